@@ -0,0 +1,384 @@
+"""Local stand-in for Ankr, JSON-RPC nodes and CoinGecko, serving synthetic data.
+
+    python -m benchmarks.fake_server --port 8600 --holders 100000 --latency 0.05 --error-rate 0.01
+
+Point the code at it with
+    ANKR_URL=http://127.0.0.1:8600/ankr
+    COINGECKO_API_URL=http://127.0.0.1:8600/coingecko
+    RPC_URLS_<CHAIN>=http://127.0.0.1:8600/rpc/<chain>
+    S3_ENDPOINT_URL=http://127.0.0.1:8600/s3 (with any AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY)
+"""
+import asyncio
+import hashlib
+import itertools
+import logging
+import random
+import time
+from argparse import ArgumentParser, Namespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from eth_abi import decode, encode
+from web3 import Web3
+
+from src.special_nft.contract import SPECIAL_NFT_ADDRESS
+
+DEFAULT_PORT = 8600
+DEFAULT_HOLDERS = 1_000
+DEFAULT_HEAD_BLOCK = 1_000_000
+DEFAULT_NFT_SUPPLY = 500
+DEFAULT_BLOCK_TIME = 2
+GENESIS_TIMESTAMP = 1_600_000_000
+ANKR_MAX_PAGE_SIZE = 10_000
+
+ZERO_WORD = bytes(32)
+TRANSFER_TOPIC = "0x" + bytes(Web3.keccak(text="Transfer(address,address,uint256)")).hex()
+
+
+def selector(signature: str) -> bytes:
+    return bytes(Web3.keccak(text=signature)[:4])
+
+
+AGGREGATE3 = selector("aggregate3((address,bool,bytes)[])")
+NAME = selector("name()")
+SYMBOL = selector("symbol()")
+DECIMALS = selector("decimals()")
+TOTAL_SUPPLY = selector("totalSupply()")
+BALANCE_OF = selector("balanceOf(address)")
+OWNER_OF = selector("ownerOf(uint256)")
+GET_NUM_MINTED = selector("getNumMinted()")
+GET_BLOCK_NUMBER = selector("getBlockNumber()")
+
+
+class SyntheticChain(object):
+    """Deterministic holders of every token: holder `i` of a token is minted its whole
+    balance at block `i * head_block // holders`, so balances and Transfer logs agree.
+    """
+
+    def __init__(self, holders: int, head_block: int, nft_supply: int) -> None:
+        self.holders = holders
+        self.head_block = head_block
+        self.nft_supply = nft_supply
+        self.total_supply = sum(map(SyntheticChain.balance, range(holders)))
+
+    @staticmethod
+    def holder(token: str, index: int) -> str:
+        return "0x" + hashlib.sha1(f"{token.lower()}:{index}".encode()).hexdigest()
+
+    @staticmethod
+    def balance(index: int) -> int:
+        return ((index * 7919) % 100_000 + 1) * 10**15
+
+    def mint_block(self, index: int) -> int:
+        return index * self.head_block // self.holders
+
+    def holder_index(self, wallet: str) -> int:
+        # balances are the same for every token, any wallet gets one from its last hex digits
+        return int(wallet[-6:], 16) % self.holders
+
+    def call(self, to: str, data: bytes) -> Tuple[bool, bytes]:
+        method = data[:4]
+        is_nft = to.lower() == SPECIAL_NFT_ADDRESS.lower()
+
+        if method == NAME:
+            return True, encode(["string"], ["Connext Rare LP NFT" if is_nft else "Connext LP"])
+        if method == SYMBOL:
+            return True, encode(["string"], ["CONNEXTRARE LP NFT" if is_nft else "CLP"])
+        if method == DECIMALS:
+            return True, encode(["uint8"], [18])
+        if method == GET_NUM_MINTED:
+            return True, encode(["uint256"], [self.nft_supply])
+        if method == GET_BLOCK_NUMBER:
+            return True, encode(["uint256"], [self.head_block])
+        if method == TOTAL_SUPPLY:
+            return True, encode(["uint256"], [self.nft_supply if is_nft else self.total_supply])
+        if method == OWNER_OF:
+            token_id = decode(["uint256"], data[4:])[0]
+            if token_id >= self.nft_supply:
+                return False, b""
+            return True, encode(["address"], [Web3.to_checksum_address(self.holder(to, token_id))])
+        if method == BALANCE_OF:
+            wallet = decode(["address"], data[4:])[0]
+            if is_nft:
+                return True, encode(["uint256"], [int(wallet[-1], 16) % 2])
+            return True, encode(["uint256"], [self.balance(self.holder_index(wallet))])
+        return False, b""
+
+    def eth_call(self, params: List[Any]) -> str:
+        to, data = params[0]["to"], bytes.fromhex(params[0]["data"][2:])
+        if data[:4] == AGGREGATE3:
+            calls = decode(["(address,bool,bytes)[]"], data[4:])[0]
+            return "0x" + encode(["(bool,bytes)[]"], [[self.call(_to, _data) for _to, _, _data in calls]]).hex()
+
+        success, result = self.call(to, data)
+        if not success:
+            raise ValueError("execution reverted")
+        return "0x" + result.hex()
+
+    def get_logs(self, params: List[Any]) -> List[Dict]:
+        query = params[0]
+        address = query["address"][0] if isinstance(query["address"], list) else query["address"]
+        is_nft = address.lower() == SPECIAL_NFT_ADDRESS.lower()
+        from_block = int(query.get("fromBlock", "0x0"), 16)
+        to_block = min(int(query.get("toBlock", hex(self.head_block)), 16), self.head_block)
+
+        # holders minted in [from_block, to_block]
+        first = -(-from_block * self.holders // self.head_block)
+        last = min((to_block + 1) * self.holders // self.head_block, self.nft_supply if is_nft else self.holders)
+
+        logs = []
+        for _index in range(max(first, 0), last):
+            _block = self.mint_block(_index)
+            _topics = [TRANSFER_TOPIC, "0x" + ZERO_WORD.hex(), "0x" + bytes(12).hex() + self.holder(address, _index)[2:]]
+            # ERC721 indexes the token id, ERC20 puts the value in data
+            if is_nft:
+                _topics.append("0x" + _index.to_bytes(32, "big").hex())
+            logs.append({
+                "address": address,
+                "topics": _topics,
+                "data": "0x" if is_nft else "0x" + self.balance(_index).to_bytes(32, "big").hex(),
+                "blockNumber": hex(_block),
+                "blockHash": "0x" + _block.to_bytes(32, "big").hex(),
+                "transactionHash": "0x" + _index.to_bytes(32, "big").hex(),
+                "transactionIndex": "0x0",
+                "logIndex": "0x0",
+                "removed": False
+            })
+        return logs
+
+    def get_block(self, params: List[Any]) -> Dict:
+        number = self.head_block if params[0] in ("latest", "pending") else min(int(params[0], 16), self.head_block)
+        return {
+            "number": hex(number),
+            "hash": "0x" + number.to_bytes(32, "big").hex(),
+            "parentHash": "0x" + max(number - 1, 0).to_bytes(32, "big").hex(),
+            "timestamp": hex(GENESIS_TIMESTAMP + number * DEFAULT_BLOCK_TIME),
+            "transactions": []
+        }
+
+    def rpc(self, method: str, params: List[Any]) -> Any:
+        if method == "eth_call":
+            return self.eth_call(params)
+        if method == "eth_getLogs":
+            return self.get_logs(params)
+        if method == "eth_blockNumber":
+            return hex(self.head_block)
+        if method == "eth_getBlockByNumber":
+            return self.get_block(params)
+        if method == "eth_chainId":
+            return "0xa"
+        if method == "eth_getCode":
+            return "0x6080"
+        raise ValueError(f"Method {method} not supported")
+
+    def token_holders(self, params: Dict) -> Dict:
+        token = params["contractAddress"]
+        page_size = min(int(params.get("pageSize", ANKR_MAX_PAGE_SIZE)), ANKR_MAX_PAGE_SIZE)
+        start = int(params.get("pageToken") or 0)
+        end = min(start + page_size, self.holders)
+
+        holders = []
+        for _index in range(start, end):
+            _balance = self.balance(_index)
+            holders.append({
+                "holderAddress": self.holder(token, _index),
+                "balance": str(_balance / 10**18),
+                "balanceRawInteger": str(_balance)
+            })
+
+        return {
+            "blockchain": params["blockchain"],
+            "contractAddress": token,
+            "tokenDecimals": 18,
+            "holders": holders,
+            "holdersCount": self.holders,
+            "nextPageToken": str(end) if end < self.holders else ""
+        }
+
+
+def decode_aws_chunked(body: bytes) -> bytes:
+    """Payload of an `aws-chunked` body, as boto3 sends uploads with trailing checksums"""
+    payload, pos = [], 0
+    while True:
+        header_end = body.index(b"\r\n", pos)
+        size = int(body[pos:header_end].split(b";")[0], 16)
+        if size == 0:
+            return b"".join(payload)
+        payload.append(body[header_end + 2:header_end + 2 + size])
+        pos = header_end + 2 + size + 2
+
+
+class FakeS3(object):
+    """In-memory objects with the S3 calls `src.s3.S3Uploader` makes: head, put and multipart uploads"""
+
+    def __init__(self) -> None:
+        self.objects: Dict[Tuple[str, str], Tuple[bytes, Dict[str, str]]] = dict()
+        self.uploads: Dict[str, Dict] = dict()
+        self._upload_ids = itertools.count()
+
+    @staticmethod
+    async def _body(request: web.Request) -> bytes:
+        body = await request.read()
+        if "aws-chunked" in request.headers.get("Content-Encoding", ""):
+            return decode_aws_chunked(body)
+        return body
+
+    @staticmethod
+    def _headers(request: web.Request) -> Dict[str, str]:
+        headers = {
+            _name: _value for _name, _value in request.headers.items()
+            if _name.lower().startswith("x-amz-meta-") or _name.lower() in ("content-type", "content-encoding")
+        }
+        # the aws-chunked marker describes the request body, not the stored object
+        if "Content-Encoding" in headers:
+            encoding = ",".join(_e for _e in headers.pop("Content-Encoding").split(",") if _e.strip() != "aws-chunked")
+            if encoding:
+                headers["Content-Encoding"] = encoding
+        return headers
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bucket, key = request.match_info["bucket"], request.match_info["key"]
+        query = request.query
+
+        if request.method == "HEAD":
+            if (bucket, key) not in self.objects:
+                return web.Response(status=404)
+            body, headers = self.objects[(bucket, key)]
+            return web.Response(headers={**headers, "Content-Length": str(len(body))})
+
+        if request.method == "GET":
+            if (bucket, key) not in self.objects:
+                return web.Response(status=404, text="<Error><Code>NoSuchKey</Code></Error>")
+            body, headers = self.objects[(bucket, key)]
+            return web.Response(body=body, headers=headers)
+
+        if request.method == "POST" and "uploads" in query:
+            upload_id = str(next(self._upload_ids))
+            self.uploads[upload_id] = {"headers": FakeS3._headers(request), "parts": dict()}
+            return web.Response(
+                content_type="application/xml",
+                text=f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                     f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            )
+
+        if request.method == "PUT" and "uploadId" in query:
+            body = await FakeS3._body(request)
+            self.uploads[query["uploadId"]]["parts"][int(query["partNumber"])] = body
+            return web.Response(headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+
+        if request.method == "POST" and "uploadId" in query:
+            upload = self.uploads.pop(query["uploadId"])
+            parts = [upload["parts"][_n] for _n in sorted(upload["parts"])]
+            digest = hashlib.md5(b"".join(hashlib.md5(_p).digest() for _p in parts)).hexdigest()
+            etag = f'"{digest}-{len(parts)}"'
+            self.objects[(bucket, key)] = (b"".join(parts), {**upload["headers"], "ETag": etag})
+            return web.Response(
+                content_type="application/xml",
+                text=f"<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                     f"<ETag>{etag}</ETag></CompleteMultipartUploadResult>"
+            )
+
+        if request.method == "PUT":
+            body = await FakeS3._body(request)
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            self.objects[(bucket, key)] = (body, {**FakeS3._headers(request), "ETag": etag})
+            return web.Response(headers={"ETag": etag})
+
+        return web.Response(status=405)
+
+
+class FakeServer(object):
+
+    def __init__(self, chain: SyntheticChain, latency: float = 0., error_rate: float = 0., seed: int = 0) -> None:
+        self.chain = chain
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests: Dict[str, int] = dict()
+        self.s3 = FakeS3()
+
+    async def _delay(self, route: str) -> Optional[web.Response]:
+        self.requests[route] = self.requests.get(route, 0) + 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        if self.random.random() < self.error_rate:
+            return web.Response(status=429, headers={"Retry-After": "0.1"}, text="rate limited")
+        return None
+
+    def _rpc_response(self, request: Dict) -> Dict:
+        try:
+            return {"jsonrpc": "2.0", "id": request["id"], "result": self.chain.rpc(request["method"], request.get("params", []))}
+        except Exception as exc:
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32000, "message": str(exc)}}
+
+    async def handle_rpc(self, request: web.Request) -> web.Response:
+        error = await self._delay("rpc")
+        if error is not None:
+            return error
+
+        body = await request.json()
+        if isinstance(body, list):
+            return web.json_response([self._rpc_response(_r) for _r in body])
+        return web.json_response(self._rpc_response(body))
+
+    async def handle_ankr(self, request: web.Request) -> web.Response:
+        error = await self._delay("ankr")
+        if error is not None:
+            return error
+
+        body = await request.json()
+        if body["method"] != "ankr_getTokenHolders":
+            return web.json_response({"jsonrpc": "2.0", "id": body["id"], "error": {"code": -32601, "message": "method not found"}})
+        return web.json_response({"jsonrpc": "2.0", "id": body["id"], "result": self.chain.token_holders(body["params"])})
+
+    async def handle_market_chart(self, request: web.Request) -> web.Response:
+        error = await self._delay("coingecko")
+        if error is not None:
+            return error
+
+        days = int(request.query.get("days", 30))
+        now = int(time.time() // 86400 * 86400)
+        prices = [[(now - (days - _i) * 86400) * 1000, 2000. + 10 * _i] for _i in range(days + 1)]
+        return web.json_response({"prices": prices, "market_caps": [], "total_volumes": []})
+
+    async def handle_s3(self, request: web.Request) -> web.Response:
+        self.requests["s3"] = self.requests.get("s3", 0) + 1
+        return await self.s3.handle(request)
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.requests)
+
+    def app(self) -> web.Application:
+        # S3 objects are stored as sent, gzip Content-Encoding included
+        app = web.Application(client_max_size=64 * 1024**2, handler_args={"auto_decompress": False})
+        app.router.add_post("/rpc/{chain}", self.handle_rpc)
+        app.router.add_post("/ankr/{key}", self.handle_ankr)
+        app.router.add_get("/coingecko/coins/{coin}/market_chart", self.handle_market_chart)
+        app.router.add_get("/stats", self.handle_stats)
+        app.router.add_route("*", "/s3/{bucket}/{key:.+}", self.handle_s3)
+        return app
+
+
+def run_parser() -> Namespace:
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--holders", type=int, default=DEFAULT_HOLDERS, help="Holders of every LP token")
+    parser.add_argument("--head-block", type=int, default=DEFAULT_HEAD_BLOCK, help="Latest block of every chain")
+    parser.add_argument("--nft-supply", type=int, default=DEFAULT_NFT_SUPPLY, help="Minted special NFTs")
+    parser.add_argument("--latency", type=float, default=0., help="Seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0., help="Fraction of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    args = run_parser()
+    server = FakeServer(
+        SyntheticChain(args.holders, args.head_block, args.nft_supply),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
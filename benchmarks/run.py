@@ -0,0 +1,318 @@
+"""Benchmarks of the reward pipeline and the bot lookups against `benchmarks.fake_server`.
+
+    python -m benchmarks.run --holders 1000,10000,100000 --latency 0.02 --error-rate 0.01
+
+Every holder count runs in its own server and worker process, so caches, pools and
+rate limiters start cold. Prints the wall time and throughput of each stage.
+"""
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from argparse import SUPPRESS, ArgumentParser, Namespace
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from src.constant import Chain
+
+DEFAULT_HOLDERS = "1000,10000,100000"
+DEFAULT_LOOKUPS = 20
+# the offline reward math runs at production scale on every benchmark run
+DEFAULT_REWARD_MATH_HOLDERS = 1_000_000
+DEFAULT_REWARD_MATH_MAX_SECONDS = 60.
+CHAINS = [
+    Chain.OPTIMISM, Chain.ARBITRUM_ONE, Chain.BNB_CHAIN, Chain.GNOSIS,
+    Chain.POLYGON, Chain.METIS, Chain.LINEA, Chain.BASE
+]
+
+
+def run_parser() -> Namespace:
+    parser = ArgumentParser()
+    parser.add_argument("--holders", type=str, default=DEFAULT_HOLDERS, help="Comma-separated holder counts, 1000 to 1000000")
+    parser.add_argument("--latency", type=float, default=0., help="Seconds the fake server adds to every response")
+    parser.add_argument("--error-rate", type=float, default=0., help="Fraction of fake server responses that are 429s")
+    parser.add_argument("--nft-supply", type=int, default=500, help="Minted special NFTs")
+    parser.add_argument("--lookups", type=int, default=DEFAULT_LOOKUPS, help="Bot wallet lookups to time")
+    parser.add_argument("--rate-limit", type=float, default=1000., help="RPC_RATE_LIMIT of the worker")
+    parser.add_argument("--reward-math-holders", type=int, default=DEFAULT_REWARD_MATH_HOLDERS, help="Synthetic holders of the offline reward math check, 0 to skip")
+    parser.add_argument("--reward-math-max-seconds", type=float, default=DEFAULT_REWARD_MATH_MAX_SECONDS, help="Fail the reward math check above this time")
+    parser.add_argument("--output", type=str, help="Write the results as JSON to this path")
+    parser.add_argument("--worker", action="store_true", help=SUPPRESS)
+    parser.add_argument("--port", type=int, help=SUPPRESS)
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(url: str, timeout: float = 30.) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Fake server at {url} didn't start")
+
+
+def worker_env(port: int, workdir: str, rate_limit: float) -> Dict[str, str]:
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.getcwd(),
+        "ANKR_KEY": "benchmark",
+        "ANKR_URL": f"{base_url}/ankr",
+        "COINGECKO_API_URL": f"{base_url}/coingecko",
+        "S3_ENDPOINT_URL": f"{base_url}/s3",
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "RPC_RATE_LIMIT": str(rate_limit),
+        "TOKEN_METADATA_CACHE": os.path.join(workdir, "token_metadata.json"),
+        "INDEXER_DIR": os.path.join(workdir, "indexer"),
+        "CHECKPOINT_DIR": os.path.join(workdir, "outputs", "checkpoints")
+    })
+    for _chain in CHAINS:
+        env[f"RPC_URLS_{_chain.upper()}"] = f"{base_url}/rpc/{_chain}"
+    return env
+
+
+class StageTimer(object):
+
+    def __init__(self) -> None:
+        self.results: List[Dict] = []
+
+    @contextmanager
+    def stage(self, name: str, items: int = 1) -> Iterator[Dict]:
+        """Time the block, `result["items"]` can be updated inside it once the count is known.
+        A failure is recorded in `result["error"]` so the other stages still run, `main` exits non-zero on it.
+        """
+        result = {"stage": name, "items": items}
+        st = time.time()
+        try:
+            yield result
+        except Exception as exc:
+            result["error"] = repr(exc)
+            logging.error(f"Stage {name} failed: {exc}")
+        result["seconds"] = time.time() - st
+        result["throughput"] = result["items"] / result["seconds"] if result["seconds"] > 0 else None
+        self.results.append(result)
+
+
+def run_worker(args: Namespace) -> List[Dict]:
+    """Run every stage against the fake server at `args.port`, called in the worker process"""
+    import asyncio
+
+    import calculate_rewards
+    from src.ankr.api import AnkrAPI
+    from src.bot.bot import get_lp_balances, get_lp_balances_async
+    from src.fixedpoint import fixed_to_raw
+    from src.merkle import MerkleTree
+    from src.price import get_weth_price
+    from src.rpc import close_async_clients
+    from src.s3 import S3Uploader
+    from src.special_nft.contract import SpecialNFTContract
+
+    chain = Chain.OPTIMISM
+    assets = ["weth", "usdc", "usdt"]
+    timer = StageTimer()
+
+    with timer.stage("ankr_holders") as result:
+        holders = {_asset: AnkrAPI().get_lp_holders_and_balance(chain, _asset, raw=True) for _asset in assets}
+        result["items"] = sum(len(_h) for _h in holders.values())
+
+    with timer.stage("coingecko_price"):
+        price = get_weth_price(ma_days=7)
+
+    with timer.stage("nft_sweep") as result:
+        nft_holders = SpecialNFTContract().holders(method="sweep")
+        result["items"] = args.nft_supply
+
+    with timer.stage("nft_logs") as result:
+        SpecialNFTContract().holders(method="logs", from_block=0)
+        result["items"] = args.nft_supply
+
+    with timer.stage("reward_math") as result:
+        dfs = []
+        for _asset, _holders in holders.items():
+            _df = calculate_rewards.dict_to_df(_holders, 18)
+            _df = calculate_rewards.resolve_holders_usd(_df, asset_price=price if _asset == "weth" else 1.)
+            _df = calculate_rewards.get_special_nft_status(_df, holders=nft_holders)
+            dfs.append(calculate_rewards.calculate_reward(_df, 1000 * 10**9))
+        rewards = calculate_rewards.merge_rewards(dfs)
+        result["items"] = sum(len(_df) for _df in dfs)
+
+    with timer.stage("transaction_batch", len(rewards)):
+        calculate_rewards.create_transaction_batch(
+            address_amounts=rewards,
+            safe_address="0x569a4edB518fc83eF4f82791c02B1bBECB5A69b3",
+            token_address="0x4200000000000000000000000000000000000042",
+            chain_id=10
+        )
+
+    with timer.stage("merkle_tree", len(rewards)):
+        MerkleTree(rewards.index, fixed_to_raw(rewards.to_numpy(), 18))
+
+    # full run, outputs go to the worker's scratch directory
+    with timer.stage("pipeline") as result:
+        argv = sys.argv
+        sys.argv = ["calculate_rewards.py", "-c", chain, "-a", ",".join(assets), "--concurrency", "3", "--usd-filter", "0"]
+        try:
+            calculate_rewards.main(calculate_rewards.run_parser())
+        finally:
+            sys.argv = argv
+        result["items"] = sum(len(_h) for _h in holders.values())
+
+    # the second pass finds every object unchanged and only sends HEADs
+    outputs = [os.path.join("outputs", _f) for _f in os.listdir("outputs") if os.path.isfile(os.path.join("outputs", _f))]
+    with S3Uploader("benchmark") as uploader:
+        for _stage in ("s3_upload", "s3_reupload"):
+            with timer.stage(_stage, len(outputs)):
+                for _path in outputs:
+                    uploader.submit(_path)
+                uploader.wait()
+
+    wallet = next(iter(holders["weth"]))
+    with timer.stage("bot_lookup", args.lookups):
+        for _ in range(args.lookups):
+            get_lp_balances(wallet)
+
+    async def _lookups() -> None:
+        for _ in range(args.lookups):
+            await get_lp_balances_async(wallet)
+        await close_async_clients()
+
+    with timer.stage("bot_lookup_async", args.lookups):
+        asyncio.run(_lookups())
+
+    return timer.results
+
+
+def run_reward_math(holders: int, max_seconds: float) -> Dict:
+    """Holders -> merged rewards of three assets on `holders` synthetic wallets, no network.
+    Fails the stage unless every total is exact and it finishes within `max_seconds`.
+    """
+    import numpy as np
+
+    import calculate_rewards
+    from src.fixedpoint import float_to_fixed
+
+    assets = ["weth", "usdc", "usdt"]
+    reward_per_asset = int(float_to_fixed(1000.))
+    rng = np.random.default_rng(0)
+    wallets = [f"0x{_i:040x}" for _i in range(holders)]
+    balances = {
+        _asset: dict(zip(wallets, (rng.integers(1, 10**6, holders) * 10**15).tolist()))
+        for _asset in assets
+    }
+    special = set(wallets[::100])
+
+    timer = StageTimer()
+    with timer.stage("reward_math_offline", holders * len(assets)) as result:
+        dfs = []
+        for _asset in assets:
+            _df = calculate_rewards.dict_to_df(balances[_asset], 18)
+            _df = calculate_rewards.resolve_holders_usd(_df, asset_price=2000. if _asset == "weth" else 1.)
+            _df = calculate_rewards.get_special_nft_status(_df, holders=special)
+            dfs.append(calculate_rewards.calculate_reward(_df, reward_per_asset))
+        rewards = calculate_rewards.merge_rewards(dfs)
+
+        # every asset pays out exactly its reward, boosts on top, and merging loses nothing
+        boosts = 0
+        for _df in dfs:
+            if int(_df["reward_without_boost_raw"].sum()) != reward_per_asset:
+                raise ValueError("Asset rewards don't sum to the budget")
+            boosts += int((_df["OP_rewards_raw"] - _df["reward_without_boost_raw"]).sum())
+        if len(rewards) != holders:
+            raise ValueError(f"Merged {len(rewards)} wallets out of {holders}")
+        if int(rewards.sum()) != reward_per_asset * len(assets) + boosts:
+            raise ValueError("Merged rewards don't sum to the budget")
+
+    if "error" not in result and result["seconds"] > max_seconds:
+        result["error"] = f"took {result['seconds']:.1f}s, over the {max_seconds:.0f}s bound"
+    return {"holders": holders, "stages": timer.results, "requests": {}}
+
+
+def run_size(holders: int, args: Namespace) -> Dict:
+    port = free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.fake_server",
+            "--port", str(port),
+            "--holders", str(holders),
+            "--nft-supply", str(args.nft_supply),
+            "--latency", str(args.latency),
+            "--error-rate", str(args.error_rate)
+        ],
+        env=dict(os.environ, PYTHONPATH=os.getcwd())
+    )
+    try:
+        wait_for_server(f"http://127.0.0.1:{port}/stats")
+        with tempfile.TemporaryDirectory() as workdir:
+            worker = subprocess.run(
+                [
+                    sys.executable, "-m", "benchmarks.run", "--worker",
+                    "--port", str(port),
+                    "--nft-supply", str(args.nft_supply),
+                    "--lookups", str(args.lookups)
+                ],
+                env=worker_env(port, workdir, args.rate_limit),
+                cwd=workdir,
+                stdout=subprocess.PIPE,
+                check=True
+            )
+        stages = json.loads(worker.stdout.decode().strip().splitlines()[-1])
+        requests = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{port}/stats").read())
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {"holders": holders, "stages": stages, "requests": requests}
+
+
+def print_results(results: List[Dict]) -> None:
+    print(f"{'holders':>9} {'stage':<18} {'seconds':>9} {'items':>9} {'items/s':>12}")
+    for _result in results:
+        for _stage in _result["stages"]:
+            throughput = "error" if "error" in _stage else f"{_stage['throughput']:.1f}"
+            print(
+                f"{_result['holders']:>9} {_stage['stage']:<18} {_stage['seconds']:>9.3f} "
+                f"{_stage['items']:>9} {throughput:>12}"
+            )
+        print(f"{_result['holders']:>9} requests: {_result['requests']}")
+
+
+def main(args: Namespace) -> None:
+    if args.worker:
+        # the last stdout line is the result, everything else goes to stderr
+        logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+        print(json.dumps(run_worker(args)))
+        return
+
+    results = [run_size(int(_holders), args) for _holders in args.holders.split(",")]
+    if args.reward_math_holders > 0:
+        results.append(run_reward_math(args.reward_math_holders, args.reward_math_max_seconds))
+    print_results(results)
+
+    if args.output is not None:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=4)
+
+    # results are printed and saved first, then any failed stage fails the run
+    failed = [f"{_r['holders']} {_s['stage']}: {_s['error']}" for _r in results for _s in _r["stages"] if "error" in _s]
+    if len(failed) > 0:
+        logging.error("Failed stages:\n" + "\n".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(run_parser())
@@ -1,5 +1,6 @@
 """Create csv files that records USDT, USDC, ETH holders
-on Optimism. The script took around 5-10 minutes to run.
+on the selected chains (Optimism by default). Stage timings of each run
+are saved to outputs/run_metrics.json.
 """
 import hashlib
 import json
@@ -7,20 +8,39 @@ import logging
 import os
 import time
 from argparse import ArgumentParser, Namespace
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Set
 
-import boto3
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from dotenv import load_dotenv
 
 from src.ankr.api import AnkrAPI
 from src.bot.utils import get_assets
+from src.checkpoint import CheckpointStore
 from src.constant import Asset, Chain
 from src.erc20 import ERC20
+from src.erc20.registry import lp_registry
+from src.fixedpoint import allocate, fixed_to_float, fixed_to_raw, fixed_to_raw_strings, float_to_fixed, raw_to_fixed
+from src.indexer import DEFAULT_CONFIRMATIONS, TransferIndexer
+from src.merkle import MerkleTree
+from src.metrics import metrics
+from src.multisend import (
+    MULTISEND_CALL_ONLY_ADDRESS, 
+    encode_multisend, 
+    estimate_gas, 
+    pack_approve, 
+    pack_transfers, 
+    transfers_per_batch
+)
 from src.price import get_weth_price
-from src.special_nft.contract import SpecialNFTContract
+from src.providers import get_provider
+from src.s3 import S3Uploader
+from src.special_nft.contract import SPECIAL_NFT_CHAIN, SpecialNFTContract
+from src.twab import DEFAULT_EPOCH_SECONDS, DEFAULT_SAMPLES, epoch_start_block, get_twab
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -30,103 +50,264 @@ def run_parser() -> Namespace:
     parser = ArgumentParser()
 
     # asset params
-    parser.add_argument("-c", "--chain", type=str, default=Chain.OPTIMISM, help="Chain to get asset")
-    parser.add_argument("-a", "--assets", type=str, default="weth,usdc,usdt", help="Assets to get balance")
+    parser.add_argument("-c", "--chain", type=str, default=Chain.OPTIMISM, help="Comma-separated chains to get asset, or `all`")
+    parser.add_argument("-a", "--assets", type=str, default="weth,usdc,usdt", help="Assets to get balance, or `all` for every LP of each chain")
+    parser.add_argument("--nft-method", type=str, choices=["sweep", "logs", "balance"], default="sweep", help="How to find special NFT holders")
+    parser.add_argument("--rpc-transport", type=str, choices=["multicall", "batch"], default="batch", help="How to send per-wallet special NFT checks with --nft-method balance")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of asset pipelines to run concurrently")
+    parser.add_argument("--holder-source", type=str, choices=["ankr", "indexer"], default="ankr", help="Where to get LP holders from")
+    parser.add_argument("--balance-mode", type=str, choices=["snapshot", "twab"], default="snapshot", help="Reward balances at the snapshot block, or time-weighted over the epoch")
+    parser.add_argument("--twab-method", type=str, choices=["transfers", "samples"], default="transfers", help="Replay Transfer logs or sample balanceOf of current holders for --balance-mode twab")
+    parser.add_argument("--twab-epoch-seconds", type=int, default=DEFAULT_EPOCH_SECONDS, help="Epoch length in seconds ending at the snapshot block, resolved to blocks per chain")
+    parser.add_argument("--twab-samples", type=int, default=DEFAULT_SAMPLES, help="Number of sample blocks for --twab-method samples")
     # price params
     parser.add_argument("--eth-ma-window", type=int, default=7, help="Moving average window for calculating ETH price")
     parser.add_argument("--usd-filter", type=float, default=100.0, help="Minimum USDT or USDC LP holdings")
     # reward params
     parser.add_argument("--reward-amount", type=float, default=2500, help="Total amount of reward to be distributed")
+    parser.add_argument("--payout", type=str, choices=["transfers", "merkle"], default="transfers", help="Pay with one transfer per wallet, or publish a Merkle distribution wallets claim from")
+    parser.add_argument("--merkle-distributor", type=str, help="Merkle distributor to fund and set the root of with --payout merkle")
+    parser.add_argument("--gas-budget", type=int, help="Split transfers into Safe batches under this estimated gas, written to outputs/transactions/")
+    parser.add_argument("--chain-budgets", type=str, help="Reward per chain, e.g. `optimism=1500,arbitrum=1000`. Defaults to an equal split of --reward-amount")
     # save params
     parser.add_argument("--save-method", type=str, choices=["local", "s3"], default="local", help="Assets to get balance")
+    parser.add_argument("--format", type=str, choices=["csv", "parquet"], default="csv", help="File format of the holder and reward tables")
     parser.add_argument("--s3-bucket", type=str, help="Name of the S3 bucket to upload the file")
+    parser.add_argument("--s3-gzip", action="store_true", help="Upload CSV and JSON outputs gzipped, under their key plus `.gz`")
+    # checkpoint params
+    parser.add_argument("--run-id", type=str, help="Id of the run under outputs/checkpoints. Defaults to the current time, or the latest run with --resume")
+    parser.add_argument("--resume", action="store_true", help="Skip stages already completed by the run")
     
     return parser.parse_args()        
 
 
-def dict_to_df(balance_dict: Dict) -> pd.DataFrame:
-    df = pd.DataFrame([
-        (_wallet, _balance)
-        for _wallet, _balance in balance_dict.items()
-    ], columns=["wallet", "balance"])
+# arguments that decide the content of checkpointed stages, a run can only be resumed with the same values
+CHECKPOINT_PARAMS = (
+    "chain", 
+    "assets", 
+    "holder_source", 
+    "balance_mode", 
+    "twab_method", 
+    "twab_epoch_seconds", 
+    "twab_samples", 
+    "nft_method", 
+    "eth_ma_window", 
+    "usd_filter", 
+    "reward_amount", 
+    "chain_budgets"
+)
+
+
+def checkpoint_params(args: Namespace) -> Dict[str, Any]:
+    return {_name: getattr(args, _name) for _name in CHECKPOINT_PARAMS}
+
+
+def parse_chains(value: str) -> List[Chain]:
+    if value == "all":
+        return lp_registry.get_chains()
+    return [_chain.strip() for _chain in value.split(",")]
+
+
+def parse_chain_budgets(value: Optional[str], chains: List[Chain], reward_amt: float) -> Dict[Chain, int]:
+    """Fixed-point reward of each chain"""
+    if value is None:
+        shares = allocate(int(float_to_fixed(reward_amt)), np.ones(len(chains)))
+        return dict(zip(chains, shares.tolist()))
+    
+    budgets = dict()
+    for _item in value.split(","):
+        _chain, _amount = _item.split("=")
+        budgets[_chain.strip()] = int(float_to_fixed(float(_amount)))
+    
+    assert set(budgets) == set(chains), f"Budgets {budgets} don't match chains {chains}"
+    return budgets
+
+
+def get_lp_holders(chain: Chain, asset: Asset, holder_source: str = "ankr", block: Optional[int] = None) -> Dict[str, int]:
+    """Raw (wei) LP balance of every holder, chains Ankr doesn't serve are read from the indexer.
+    The indexer reads balances at `block`, Ankr only serves the latest ones.
+    """
+    if holder_source == "indexer" or not AnkrAPI.supports(chain):
+        # local Transfer log index, only new blocks are fetched
+        indexer = TransferIndexer(chain, lp_registry.address(chain, asset))
+        indexer.sync(to_block=block)
+        return indexer.balances(block)
     
-    df = df.sort_values("balance", ascending=False)
+    return AnkrAPI().get_lp_holders_and_balance(chain, asset, raw=True)
+
+
+def get_lp_twab(chain: Chain, asset: Asset, end_block: int, args: Namespace) -> Dict[str, float]:
+    """Time-weighted LP balance of every holder in raw units, fractional as they're averages"""
+    # the same duration is a different block count on every chain
+    start_block = epoch_start_block(chain, end_block, args.twab_epoch_seconds)
+    
+    # sampling needs the wallets up front, take the current holders
+    wallets = None
+    if args.twab_method == "samples":
+        wallets = list(get_lp_holders(chain, asset, args.holder_source, end_block))
+    
+    return get_twab(
+        chain, 
+        lp_registry.address(chain, asset), 
+        start_block, 
+        end_block, 
+        method=args.twab_method, 
+        wallets=wallets, 
+        samples=args.twab_samples,
+        raw=True
+    )
+
+
+def dict_to_df(balance_dict: Dict, decimals: int) -> pd.DataFrame:
+    """Raw balances to fixed-point `balance_raw`, `balance` in tokens is for display and USD filtering only"""
+    balance_raw = raw_to_fixed(balance_dict.values(), decimals)
+    df = pd.DataFrame({
+        "wallet": list(balance_dict.keys()),
+        "balance_raw": balance_raw,
+        "balance": fixed_to_float(balance_raw)
+    })
+    
+    df = df.sort_values("balance_raw", ascending=False, kind="stable")
     
     return df
 
 
-def resolve_holders_usd(df: pd.DataFrame, eth_ma_window: Optional[int] = None) -> pd.DataFrame:
+def resolve_holders_usd(df: pd.DataFrame, eth_ma_window: Optional[int] = None, asset_price: Optional[float] = None) -> pd.DataFrame:
     # if eth_ma_window is not provided, use fix 1 USD value
-    asset_price = 1. if eth_ma_window is None else get_weth_price(ma_days=eth_ma_window)
+    if asset_price is None:
+        asset_price = 1. if eth_ma_window is None else get_weth_price(ma_days=eth_ma_window)
     
     logging.info(f"Using asset price of {asset_price}")
     
-    df["usd_value"] = df["balance"].map(lambda x: x * asset_price)
+    df["usd_value"] = df["balance"] * asset_price
     return df
 
 
-def get_special_nft_status(df: pd.DataFrame) -> pd.DataFrame:
+def get_special_nft_status(
+    df: pd.DataFrame, 
+    holders: Optional[Set[str]] = None, 
+    transport: str = "batch", 
+    block: Optional[int] = None
+) -> pd.DataFrame:
+    new_df = df[["wallet", "balance_raw", "balance", "usd_value"]].copy()
     
-    def check_nft_status(row):
-        try:
-            is_special = SpecialNFTContract().balance_of(row["wallet"]) > 0
-            return row["wallet"], row["balance"], row["usd_value"], is_special
-        except Exception as exc:
-            logging.error(exc)
-            return row["wallet"], row["balance"], row["usd_value"], False
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {executor.submit(check_nft_status, row): row for _, row in df.iterrows()}
-
-        results = []
-        for future in as_completed(futures):
-            result = future.result()
-            if result:
-                results.append(result)
-
-    # Creating a new DataFrame from the results
-    new_df = pd.DataFrame(results, columns=["wallet", "balance", "usd_value", "is_special"])
+    # holder set built once per run, the check is a set lookup
+    if holders is not None:
+        new_df["is_special"] = new_df["wallet"].str.lower().isin(holders)
+        return new_df
+    
+    # otherwise every wallet's balanceOf in a handful of batched requests
+    balances = SpecialNFTContract().batch_balance_of(
+        df["wallet"].tolist(), 
+        transport=transport, 
+        block_identifier="latest" if block is None else block
+    )
+    
+    failed = [_wallet for _wallet, _balance in balances.items() if _balance is None]
+    if len(failed) > 0:
+        logging.error(f"Failed to read special NFT balance of {len(failed)} wallets")
+    
+    new_df["is_special"] = new_df["wallet"].map(lambda x: (balances[x] or 0) > 0)
     return new_df
 
 
 def calculate_reward(df: pd.DataFrame, reward_amt: int) -> pd.DataFrame:
+    """`reward_amt` is fixed-point, see `src.fixedpoint`"""
+    reward_raw = int(reward_amt)
     
-    # weight score by usd_value
-    df["weighted_score"] = df["usd_value"] / sum(df["usd_value"])
+    # weight score by usd_value, the asset price is shared so balances weigh the same
+    df["weighted_score"] = df["usd_value"] / df["usd_value"].sum()
     
-    # calculate reward
-    df["reward_without_boost"] = df["weighted_score"] * reward_amt
+    # calculate reward on fixed-point integers, shares sum to exactly reward_amt
+    df["reward_without_boost_raw"] = allocate(reward_raw, df["balance_raw"].to_numpy())
     
     # make sure total reward don't exceed reward_amt
-    _chk_sum = sum(df["reward_without_boost"])
-    assert reward_amt - _chk_sum <= 1e-8, f"{_chk_sum} > {reward_amt}"
+    _chk_sum = int(df["reward_without_boost_raw"].sum())
+    assert _chk_sum <= reward_raw, f"{_chk_sum} > {reward_raw}"
     
     # calculate boosted reward if is_special
     # boost by 10%
-    df["OP_rewards"] = df["reward_without_boost"] * 1.1 * df["is_special"] + df["reward_without_boost"] * ~df["is_special"]
+    df["OP_rewards_raw"] = df["reward_without_boost_raw"] + np.where(df["is_special"], df["reward_without_boost_raw"] // 10, 0)
+    
+    # decimal columns for display
+    df["reward_without_boost"] = fixed_to_float(df["reward_without_boost_raw"])
+    df["OP_rewards"] = fixed_to_float(df["OP_rewards_raw"])
     
     return df
 
 
-def upload_to_s3(file_path: str, bucket: str, key: Optional[str] = None, public: bool = True) -> None:
-    logging.info(f"Pushing {file_path} to S3")
-    key = os.path.basename(file_path) if key is None else key
-    
-    # set ACL to public-read
-    extra_args = {"ACL": "public-read"} if public else {}
+def merge_rewards(dfs: List[pd.DataFrame]) -> pd.Series:
+    """Sum fixed-point OP rewards of each wallet across all assets, sorted by reward descending"""
+    return pd.concat([_df[["wallet", "OP_rewards_raw"]] for _df in dfs], ignore_index=True)\
+        .groupby("wallet")["OP_rewards_raw"].sum()\
+        .sort_values(ascending=False, kind="stable")
+
+
+def wallets_to_binary(wallets: pd.Series) -> pa.Array:
+    """Hex wallet addresses to a fixed-width binary(20) column"""
+    buffer = bytes.fromhex(wallets.str.slice(2).str.cat())
+    return pa.FixedSizeBinaryArray.from_buffers(pa.binary(20), len(wallets), [None, pa.py_buffer(buffer)])
+
+
+def save_table(df: pd.DataFrame, output_path: str, file_format: str = "csv") -> str:
+    """Save `df` to `output_path` with the extension of `file_format`, returns the written path"""
+    output_path = f"{os.path.splitext(output_path)[0]}.{file_format}"
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
-    s3_client = boto3.client("s3")
-    s3_client.upload_file(file_path, bucket, key, ExtraArgs=extra_args)
-    logging.info("File push to S3 successfully")
+    if file_format == "csv":
+        df.to_csv(output_path, index=False)
+        return output_path
     
+    # typed columns, readers can load only the ones they need
+    df = df.copy()
+    if "updated_at" in df.columns:
+        df["updated_at"] = pd.to_datetime(df["updated_at"])
+    table = pa.Table.from_pandas(df.drop(columns="wallet"), preserve_index=False)
+    table = table.add_column(0, "wallet", wallets_to_binary(df["wallet"]))
     
+    pq.write_table(table, output_path, compression="zstd")
+    return output_path
+
+
+def new_transaction_batch(safe_address: str, chain_id: int) -> Dict[str, Any]:
+    """Empty Safe transaction builder batch"""
+    return {
+        "version": "1.0",
+        "chainId": str(chain_id),  # Assuming Ethereum mainnet
+        "createdAt": int(datetime.now().timestamp() * 1000),  # Current time in milliseconds
+        "meta": {
+            "name": "Transactions Batch",
+            "description": "",
+            "txBuilderVersion": "1.16.3",
+            "createdFromSafeAddress": safe_address,
+            "createdFromOwnerAddress": "",
+            "checksum": ""
+        },
+        "transactions": []
+    }
+
+
+def sign_transaction_batch(transaction_batch: Dict[str, Any]) -> Dict[str, Any]:
+    # Generate checksum
+    checksum = hashlib.sha256(json.dumps(transaction_batch, sort_keys=True).encode()).hexdigest()
+    transaction_batch["meta"]["checksum"] = checksum
+
+    return transaction_batch
+
+
 def create_transaction_batch(
-    address_amounts: Dict[str, float], 
+    address_amounts: pd.Series, 
     safe_address: str, 
     token_address: str, 
     chain_id: int,
-    approve_tx: bool = True
+    approve_tx: bool = True,
+    multisend: bool = False,
+    approve_amount: Optional[int] = None
 ) -> Dict[str, Any]:
+    """Safe transaction builder batch paying `address_amounts`, fixed-point amounts indexed by wallet.
+    The approve covers `approve_amount` (fixed-point), the batch total by default.
+    With `multisend`, the calls are also packed as MultiSendCallOnly calldata under "multiSend".
+    """
     # get chain name
     if chain_id == 10:
         chain = Chain.OPTIMISM
@@ -139,25 +320,12 @@ def create_transaction_batch(
     ).decimal
     
     # Prepare the batch structure
-    transaction_batch = {
-        "version": "1.0",
-        "chainId": str(chain_id),  # Assuming Ethereum mainnet
-        "createdAt": int(datetime.now().timestamp() * 1000),  # Current time in milliseconds
-        "meta": {
-            "name": "Transactions Batch",
-            "description": "",
-            "txBuilderVersion": "1.16.3",
-            "createdFromSafeAddress": safe_address,
-            "createdFromOwnerAddress": "",
-            "checksum": ""
-        },
-        "transactions": []
-    }
+    transaction_batch = new_transaction_batch(safe_address, chain_id)
     
     # Add approve transaction if needed
     if approve_tx:
-        total_amount = sum(address_amounts.values())
-        approve_amount = int(total_amount * (10 ** decimal))  # Total amount in token's smallest unit
+        total_amount = pd.Series([address_amounts.sum() if approve_amount is None else approve_amount], dtype=np.int64)
+        approve_raw = int(fixed_to_raw_strings(total_amount, decimal).iloc[0])  # Total amount in token's smallest unit
         approve_transaction = {
             "to": token_address,
             "value": "0",
@@ -172,14 +340,14 @@ def create_transaction_batch(
             },
             "contractInputsValues": {
                 "spender": safe_address,
-                "amount": str(approve_amount)
+                "amount": str(approve_raw)
             }
         }
         transaction_batch["transactions"].append(approve_transaction)
 
     # Add transfer transactions
-    for address, amount in address_amounts.items():
-        wei_amount = int(amount * (10 ** decimal))  # Convert token amount to smallest unit
+    wei_amounts = fixed_to_raw_strings(address_amounts, decimal)  # Convert token amount to smallest unit
+    for address, wei_amount in zip(address_amounts.index, wei_amounts):
         transaction = {
             "to": token_address,
             "value": "0",
@@ -194,30 +362,252 @@ def create_transaction_batch(
             },
             "contractInputsValues": {
                 "to": address,
-                "amount": str(wei_amount)
+                "amount": wei_amount
             }
         }
         transaction_batch["transactions"].append(transaction)
 
-    # Generate checksum
-    checksum = hashlib.sha256(json.dumps(transaction_batch, sort_keys=True).encode()).hexdigest()
-    transaction_batch["meta"]["checksum"] = checksum
+    # the same transfers as a single delegatecall to MultiSendCallOnly
+    if multisend:
+        raw_amounts = fixed_to_raw(address_amounts.to_numpy(), decimal)
+        calls = pack_transfers(token_address, address_amounts.index, raw_amounts)
+        if approve_tx:
+            calls = pack_approve(token_address, safe_address, approve_raw) + calls
+        transaction_batch["multiSend"] = {
+            "to": MULTISEND_CALL_ONLY_ADDRESS,
+            "operation": 1,
+            "data": encode_multisend(calls),
+            "estimatedGas": estimate_gas(len(address_amounts), approvals=int(approve_tx))
+        }
 
-    return transaction_batch
+    return sign_transaction_batch(transaction_batch)
+
+
+def write_transaction_batches(
+    address_amounts: pd.Series, 
+    safe_address: str, 
+    token_address: str, 
+    chain_id: int,
+    gas_budget: int,
+    output_dir: str = "outputs/transactions"
+) -> List[str]:
+    """Split transfers into batches of at most `gas_budget` estimated gas, each one written to
+    `output_dir` with its own checksum as soon as it's built. Returns the written paths, index first.
+    
+    The first batch carries a single approve of the whole payout, and fewer transfers to make room for it.
+    """
+    if len(address_amounts) == 0:
+        # a lone approve(0) would be a batch with nothing to pay
+        logging.warning("No rewards to pay, no transaction batches written")
+        return []
+    
+    size = transfers_per_batch(gas_budget)
+    first_size = transfers_per_batch(gas_budget, approvals=1)
+    bounds = [0] + list(range(first_size, len(address_amounts), size)) + [len(address_amounts)]
+    total_amount = int(address_amounts.sum())
+    os.makedirs(output_dir, exist_ok=True)
+    
+    index, paths = [], []
+    for _number, (_start, _end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        _amounts = address_amounts.iloc[_start:_end]
+        _batch = create_transaction_batch(
+            address_amounts=_amounts,
+            safe_address=safe_address,
+            token_address=token_address,
+            chain_id=chain_id,
+            approve_tx=_number == 0,
+            multisend=True,
+            approve_amount=total_amount
+        )
+        
+        _path = os.path.join(output_dir, f"batch_{_number:04d}.json")
+        with open(_path, "w") as fp:
+            json.dump(_batch, fp, indent=4)
+        paths.append(_path)
+        
+        index.append({
+            "file": os.path.basename(_path),
+            "transfers": len(_amounts),
+            "estimatedGas": _batch["multiSend"]["estimatedGas"],
+            "checksum": _batch["meta"]["checksum"]
+        })
+    
+    index_path = os.path.join(output_dir, "index.json")
+    with open(index_path, "w") as fp:
+        json.dump({"gasBudget": gas_budget, "batches": index}, fp, indent=4)
+    
+    logging.info(f"Wrote {len(index)} batches of up to {size} transfers to {output_dir}")
+    return [index_path] + paths
+
+
+def create_merkle_batch(
+    tree: MerkleTree, 
+    safe_address: str, 
+    token_address: str, 
+    distributor_address: str, 
+    chain_id: int
+) -> Dict[str, Any]:
+    """Safe batch funding a Merkle distributor with the total of `tree` and setting its root, 
+    wallets then claim with their proofs
+    """
+    transaction_batch = new_transaction_batch(safe_address, chain_id)
+    
+    # Fund the distributor
+    transaction_batch["transactions"].append({
+        "to": token_address,
+        "value": "0",
+        "data": None,
+        "contractMethod": {
+            "inputs": [
+                {"internalType": "address", "name": "to", "type": "address"},
+                {"internalType": "uint256", "name": "amount", "type": "uint256"}
+            ],
+            "name": "transfer",
+            "payable": False
+        },
+        "contractInputsValues": {
+            "to": distributor_address,
+            "amount": str(sum(tree.amounts))
+        }
+    })
+    
+    # Publish the root of this epoch
+    transaction_batch["transactions"].append({
+        "to": distributor_address,
+        "value": "0",
+        "data": None,
+        "contractMethod": {
+            "inputs": [
+                {"internalType": "bytes32", "name": "merkleRoot", "type": "bytes32"}
+            ],
+            "name": "setMerkleRoot",
+            "payable": False
+        },
+        "contractInputsValues": {
+            "merkleRoot": tree.root
+        }
+    })
+    
+    return sign_transaction_batch(transaction_batch)
+
+
+def process_asset(
+    chain: Chain, 
+    asset: Asset, 
+    reward_amt: int, 
+    args: Namespace, 
+    store: CheckpointStore,
+    special_nft_holders: Optional[Set[str]] = None,
+    uploader: Optional[S3Uploader] = None
+) -> pd.DataFrame:
+    """Holders -> USD value -> NFT boost -> rewards pipeline of a single LP asset
+    
+    Each stage is checkpointed in `store`, a resumed run skips the ones already done.
+    """
+    
+    def _get_holders() -> pd.DataFrame:
+        st = time.time()
+        logging.info(f"Getting holders/balance for Connext {asset} LP")
+        if args.balance_mode == "twab":
+            holders = get_lp_twab(chain, asset, store.snapshot_blocks[chain], args)
+        else:
+            holders = get_lp_holders(chain, asset, args.holder_source, store.snapshot_blocks[chain])
+        logging.info(f"All {asset} holders retrieved. Took {time.time() - st:.2f} seconds")
+        return dict_to_df(holders, lp_registry.get(chain, asset).decimals)
+    
+    # convert to dataframe
+    df = store.stage("holders", asset, _get_holders, chain=chain)
+
+    # resolve and filter USD price
+    eth_ma_window = args.eth_ma_window if asset == Asset.WETH else None
+    asset_price = None
+    if eth_ma_window is not None:
+        asset_price = store.stage(
+            "prices", 
+            f"{asset}_ma{eth_ma_window}", 
+            lambda: pd.DataFrame({"price": [get_weth_price(ma_days=eth_ma_window)]})
+        )["price"].iloc[0]
+    df = resolve_holders_usd(df=df, eth_ma_window=eth_ma_window, asset_price=asset_price)
+
+    # apply filter
+    df = df[df["usd_value"] >= args.usd_filter]
+
+    # get special NFT status
+    df = store.stage(
+        "nft_flags", 
+        asset, 
+        lambda: get_special_nft_status(
+            df, 
+            holders=special_nft_holders, 
+            transport=args.rpc_transport, 
+            block=store.snapshot_blocks[SPECIAL_NFT_CHAIN]
+        ), 
+        chain=chain
+    )
+
+    def _get_rewards() -> pd.DataFrame:
+        # sort by usd value
+        rewards = df.sort_values("usd_value", ascending=False)
+
+        # calculate rewards
+        rewards = calculate_reward(rewards, reward_amt=reward_amt)
+
+        # assign date for further sanity check
+        rewards["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return rewards
+    
+    df = store.stage("rewards", asset, _get_rewards, chain=chain)
+
+    # save to local
+    with metrics.stage("save"):
+        output_path = save_table(df, f"outputs/{chain}_{asset}_holder_balance", args.format)
+
+    # push to s3 in the background if needed
+    if uploader is not None:
+        uploader.submit(output_path)
+
+    logging.info(f"Holder statistics for {asset} was saved to {output_path}")
+
+    return df
+
+
+def process_chain(
+    chain: Chain, 
+    assets: List[Asset], 
+    reward_amt: int, 
+    args: Namespace, 
+    store: CheckpointStore,
+    special_nft_holders: Optional[Set[str]] = None,
+    uploader: Optional[S3Uploader] = None
+) -> List[pd.DataFrame]:
+    # split in fixed-point so the asset rewards add up to the chain budget exactly
+    reward_per_asset = dict(zip(assets, allocate(reward_amt, np.ones(len(assets))).tolist()))
+    logging.info(f"{chain}: {len(assets)} assets with a total reward of {fixed_to_float(reward_amt)}")
+    
+    # assets are independent and mostly wait on network I/O, run them side by side
+    with ThreadPoolExecutor(max_workers=min(args.concurrency, len(assets))) as executor:
+        futures = {
+            _asset: executor.submit(
+                process_asset, chain, _asset, reward_per_asset[_asset], args, store, special_nft_holders, uploader
+            )
+            for _asset in assets
+        }
+        # collect in the order assets were given so the merge is deterministic
+        return [futures[_asset].result() for _asset in assets]
 
 
 def main(args: Namespace) -> None:
     global_st = time.time()
+    metrics.reset()
     
     if load_dotenv():
         logging.info(f".env loaded!")
         
     # unpack args
-    chain = args.chain
+    chains = parse_chains(args.chain)
     assets = args.assets.split(",")
-    
-    eth_ma_window = args.eth_ma_window
-    usd_filter = args.usd_filter
+    holder_source = args.holder_source
+    nft_method = args.nft_method
     
     reward_amt = args.reward_amount
     
@@ -228,93 +618,168 @@ def main(args: Namespace) -> None:
     if save_method == "s3" and s3_bucket is None:
         raise Exception("S3 saving requires bucket specification")
     
-    # sanity asset/chain check
-    assert chain in [Chain.OPTIMISM], f"{chain} not supported"
-    all_assets = get_assets(chain)
-    assert all(_a in all_assets for _a in assets), f"Invalid asset: {assets}"
+    # sanity asset/chain check, the indexer works on every chain
+    chain_assets = dict()
+    for _chain in chains:
+        all_assets = get_assets(_chain)
+        chain_assets[_chain] = all_assets if assets == ["all"] else [_a for _a in assets if _a in all_assets]
+        assert len(chain_assets[_chain]) > 0, f"No asset of {assets} on {_chain}"
+    
+    if assets != ["all"]:
+        supported = {_a for _assets in chain_assets.values() for _a in _assets}
+        assert all(_a in supported for _a in assets), f"Invalid asset: {assets}"
     
-    # initialize API
-    api = AnkrAPI()
+    # replayed TWAB reads the indexer only
+    uses_ankr = holder_source == "ankr" and not (args.balance_mode == "twab" and args.twab_method == "transfers")
+    indexer_chains = [_chain for _chain in chains if not AnkrAPI.supports(_chain)]
+    if uses_ankr and len(indexer_chains) > 0:
+        logging.warning(f"Ankr doesn't serve {indexer_chains}, their holders are read from the Transfer indexer")
+    if uses_ankr and len(indexer_chains) < len(chains):
+        logging.warning("Ankr holders are the latest ones, not pinned to the snapshot block. Use --holder-source indexer for exact snapshots")
     
     # calculate reward distribution
-    reward_per_asset = reward_amt / len(assets)
-    logging.info(f"There're {len(assets)} with a total reward of {reward_amt}")
-    logging.info(f"Each asset will be allocated reward for {reward_amt}")
+    chain_budgets = parse_chain_budgets(args.chain_budgets, chains, reward_amt)
+    logging.info(f"There're {len(chains)} chains with a total reward of {fixed_to_float(sum(chain_budgets.values()))}")
     
-    final_rewards = dict()
-    for _asset in assets:
-        
-        st = time.time()
-        logging.info(f"Getting holders/balance for Connext {_asset} LP")
-        holders = api.get_lp_holders_and_balance(chain, _asset)
-        logging.info(f"All holders retrieved. Took {time.time() - st:.2f} seconds")
-        
-        # convert to dataframe
-        df = dict_to_df(holders)
-        
-        # resolve and filter USD price
-        df = resolve_holders_usd(
-            df=df, 
-            eth_ma_window=eth_ma_window if _asset == Asset.WETH else None
-        )
-        
-        # apply filter
-        df = df[df["usd_value"] >= usd_filter]
-        
-        # get special NFT status
-        df = get_special_nft_status(df)
-        
-        # sort by usd value
-        df = df.sort_values("usd_value", ascending=False)
-        
-        # calculate rewards
-        df = calculate_reward(df, reward_amt=reward_per_asset)
-        
-        # assign date for further sanity check
-        df["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # save to local
-        output_path = f"outputs/{chain}_{_asset}_holder_balance.csv"
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        df.to_csv(output_path, index=False)
-        
-        # push to s3 if needed
-        if save_method == "s3":
-            upload_to_s3(output_path, s3_bucket)
-        
-        logging.info(f"Holder statistics for was saved to {output_path}")
+    # every stage of the run is checkpointed under its snapshot block
+    store = CheckpointStore(run_id=args.run_id, resume=args.resume, params=checkpoint_params(args))
+    # the special NFT is read on its own chain, pinned like the LP chains. Snapshots stay
+    # behind the head by the indexer's confirmations so the indexed blocks can't be reorged
+    store.set_snapshot_blocks(
+        lambda _chain: get_provider(_chain).eth.block_number - DEFAULT_CONFIRMATIONS, 
+        list(dict.fromkeys(chains + [SPECIAL_NFT_CHAIN]))
+    )
+    logging.info(f"Run {store.run_id} at snapshot blocks {store.snapshot_blocks}")
+    
+    # one client for every upload, files go up while the rest of the run computes
+    uploader = S3Uploader(s3_bucket, compress=args.s3_gzip) if save_method == "s3" else None
+    
+    # special NFT holders are enumerated once for all assets
+    special_nft_holders = None
+    if nft_method != "balance":
+        def _get_nft_holders() -> pd.DataFrame:
+            st = time.time()
+            holders = SpecialNFTContract().holders(method=nft_method, block=store.snapshot_blocks[SPECIAL_NFT_CHAIN])
+            logging.info(f"Found {len(holders)} special NFT holders. Took {time.time() - st:.2f} seconds")
+            return pd.DataFrame({"wallet": sorted(holders)})
         
-        # update final rewards from df
-        for _, _row in df[["wallet", "OP_rewards"]].iterrows():
-            if _row.wallet not in final_rewards:
-                final_rewards[_row.wallet] = _row.OP_rewards
-            else:
-                final_rewards[_row.wallet] += _row.OP_rewards
-        final_rewards = {
-            k: v for k, v 
-            in sorted(final_rewards.items(), key=lambda x: x[1], reverse=True)}
+        special_nft_holders = set(store.stage("nft_holders", nft_method, _get_nft_holders)["wallet"])
+    
+    # chains are fetched concurrently, so N chains take about as long as one
+    with ThreadPoolExecutor(max_workers=len(chains)) as executor:
+        futures = {
+            _chain: executor.submit(
+                process_chain, 
+                _chain, 
+                chain_assets[_chain], 
+                chain_budgets[_chain], 
+                args, 
+                store, 
+                special_nft_holders, 
+                uploader
+            )
+            for _chain in chains
+        }
+        asset_dfs = [_df for _chain in chains for _df in futures[_chain].result()]
+    
+    # merge rewards across assets
+    with metrics.stage("merge"):
+        final_rewards = merge_rewards(asset_dfs)
                 
     # save final reward
-    with open("outputs/op_reward.json", "w") as fp:
-        json.dump(final_rewards, fp, indent=4)
+    with metrics.stage("save"):
+        with open("outputs/op_reward.json", "w") as fp:
+            json.dump(dict(zip(final_rewards.index, fixed_to_float(final_rewards).tolist())), fp, indent=4)
         
+        reward_path = None
+        if args.format == "parquet":
+            reward_path = save_table(
+                pd.DataFrame({
+                    "wallet": final_rewards.index, 
+                    "OP_rewards": fixed_to_float(final_rewards), 
+                    "OP_rewards_raw": final_rewards.to_numpy()
+                }), 
+                "outputs/op_reward", 
+                args.format
+            )
+        
+    safe_address = "0x569a4edB518fc83eF4f82791c02B1bBECB5A69b3"  # ltf multisig
+    token_address = "0x4200000000000000000000000000000000000042"  # token id
+    
+    # merkle root and proofs of every claim
+    merkle_paths = []
+    if args.payout == "merkle":
+        st = time.time()
+        with metrics.stage("merkle_tree"):
+            tree = MerkleTree(
+                final_rewards.index, 
+                fixed_to_raw(final_rewards.to_numpy(), ERC20(Chain.OPTIMISM, token_address).decimal)
+            )
+            merkle_paths = [
+                "outputs/merkle_distribution.parquet",
+                tree.save("outputs/merkle_distribution.parquet", {"chainId": 10, "token": token_address})
+            ]
+        logging.info(f"Merkle root {tree.root} of {len(final_rewards)} claims. Took {time.time() - st:.2f} seconds")
+    
     # save batch txs
-    with open("outputs/transactions.json", "w") as fp:
-        json.dump(
-            create_transaction_batch(
+    transaction_batch = None
+    batch_paths = []
+    with metrics.stage("transaction_batch"):
+        if args.payout == "transfers" and args.gas_budget is not None:
+            batch_paths = write_transaction_batches(
+                address_amounts=final_rewards,
+                safe_address=safe_address,
+                token_address=token_address,
+                chain_id=10,  # Optimism
+                gas_budget=args.gas_budget
+            )
+        elif args.payout == "transfers":
+            transaction_batch = create_transaction_batch(
                 address_amounts=final_rewards,
-                safe_address="0x569a4edB518fc83eF4f82791c02B1bBECB5A69b3",  # ltf multisig
-                token_address="0x4200000000000000000000000000000000000042",  # token id
+                safe_address=safe_address,
+                token_address=token_address,
                 chain_id=10  # Optimism
-            ),
-            fp,
-            indent=4
-        )
+            )
+        elif args.merkle_distributor is not None:
+            transaction_batch = create_merkle_batch(
+                tree=tree,
+                safe_address=safe_address,
+                token_address=token_address,
+                distributor_address=args.merkle_distributor,
+                chain_id=10  # Optimism
+            )
+    
+        if transaction_batch is not None:
+            with open("outputs/transactions.json", "w") as fp:
+                json.dump(transaction_batch, fp, indent=4)
+        elif os.path.exists("outputs/transactions.json"):
+            # left by a previous run, it doesn't pay out this one
+            os.remove("outputs/transactions.json")
+            logging.info("Removed a stale outputs/transactions.json, this run has no single transaction batch")
         
-    # push to s3 if needed
-    if save_method == "s3":
-        upload_to_s3("outputs/op_reward.json", s3_bucket)
-        upload_to_s3("outputs/transactions.json", s3_bucket)
+    # push to s3 if needed, then wait for every upload of the run
+    if uploader is not None:
+        uploader.submit("outputs/op_reward.json")
+        if reward_path is not None:
+            uploader.submit(reward_path)
+        if transaction_batch is not None:
+            uploader.submit("outputs/transactions.json")
+        for _path in merkle_paths + batch_paths:
+            uploader.submit(_path)
+        with metrics.stage("upload"):
+            uploaded = uploader.wait()
+        logging.info(f"{uploaded} files pushed to S3, the rest were unchanged")
+    
+    # machine-readable timings and request stats, compared across runs to catch regressions
+    metrics_path = metrics.save(
+        "outputs/run_metrics.json", 
+        run_id=store.run_id, 
+        snapshot_blocks=store.snapshot_blocks,
+        holders=len(final_rewards)
+    )
+    if uploader is not None:
+        uploader.upload(metrics_path)
+        uploader.close()
         
     logging.info(f"Process finished in {time.time() - global_st:.2f} seconds")
 
@@ -1,11 +1,16 @@
-import logging
 import os
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Dict, Optional, Union
 
 import requests
 
-from ..erc20 import ERC20
+from ..erc20.registry import lp_registry
 from ..constant import Chain, Asset
+from ..metrics import metrics
+from ..ratelimit import retry_rate_limited
+
+# Ankr multichain endpoint, the API key is appended to it
+ANKR_URL = os.getenv("ANKR_URL", "https://rpc.ankr.com/multichain")
 
 
 class AnkrAPI(object):
@@ -17,14 +22,58 @@ class AnkrAPI(object):
     def __get_key(self) -> Optional[str]:
         return os.getenv("ANKR_KEY", None)
     
+    @staticmethod
+    def supports(chain: Chain) -> bool:
+        try:
+            AnkrAPI.resolve_chain(chain)
+        except ValueError:
+            return False
+        return True
+    
     @staticmethod
     def resolve_chain(chain: Chain) -> str:
+        """Source from https://www.ankr.com/docs/advanced-api/overview/#chains-supported"""
         if chain == Chain.OPTIMISM:
             return "optimism"
+        elif chain == Chain.ARBITRUM_ONE:
+            return "arbitrum"
+        elif chain == Chain.BNB_CHAIN:
+            return "bsc"
+        elif chain == Chain.POLYGON:
+            return "polygon"
+        elif chain == Chain.GNOSIS:
+            return "gnosis"
+        elif chain == Chain.LINEA:
+            return "linea"
+        elif chain == Chain.BASE:
+            return "base"
         else:
             raise ValueError(f"chain {chain} doesn't supported yet.")
     
-    def get_token_holders_and_balance(self, chain: Chain, address: str) -> Dict[str, float]:
+    def __post(self, chain: Chain, headers: Dict[str, str], body: Dict[str, Any]) -> requests.Response:
+        def _send() -> requests.Response:
+            st = time.perf_counter()
+            r = requests.post(
+                f"{ANKR_URL}/{self.__get_key()}",
+                headers=headers,
+                json=body
+            )
+            metrics.record_request(
+                "ankr", chain, body["method"], time.perf_counter() - st, 
+                len(r.request.body or b""), len(r.content), ok=r.status_code == 200
+            )
+            return r
+        
+        # 429s are retried after their Retry-After, other failures are raised by the caller
+        return retry_rate_limited(_send, "ankr", chain, body["method"])
+    
+    @staticmethod
+    def parse_balance(holder: Dict[str, str], raw: bool = False) -> Union[int, float]:
+        # `balanceRawInteger` is the exact uint256 balance, `balance` is already scaled by decimals
+        return int(holder["balanceRawInteger"]) if raw else float(holder["balance"])
+    
+    def get_token_holders_and_balance(self, chain: Chain, address: str, raw: bool = False) -> Dict[str, Union[int, float]]:
+        """Balance of every holder of `address`, in raw token units (wei) with `raw=True`"""
         # initialize
         holders = dict()
         
@@ -46,12 +95,7 @@ class AnkrAPI(object):
         }
         
         # request API
-        url = f"https://rpc.ankr.com/multichain/{self.__get_key()}"
-        r = requests.post(
-            url,
-            headers=headers,
-            json=body
-        )
+        r = self.__post(chain, headers, body)
         
         # raise exception if fail
         if r.status_code != 200:
@@ -65,7 +109,7 @@ class AnkrAPI(object):
         
         # update holders
         for _holder in r["holders"]:
-            _balance = float(_holder["balance"])
+            _balance = AnkrAPI.parse_balance(_holder, raw)
             _address = _holder["holderAddress"]
             
             assert _address not in holders
@@ -92,11 +136,7 @@ class AnkrAPI(object):
             }
             
             # request API
-            r = requests.post(
-                f"https://rpc.ankr.com/multichain/{self.__get_key()}",
-                headers=headers,
-                json=body
-            )
+            r = self.__post(chain, headers, body)
             
             # raise exception if fail
             if r.status_code != 200:
@@ -107,7 +147,7 @@ class AnkrAPI(object):
             
             # update holders
             for _holder in r["holders"]:
-                _balance = float(_holder["balance"])
+                _balance = AnkrAPI.parse_balance(_holder, raw)
                 _address = _holder["holderAddress"]
                 
                 assert _address not in holders, f"Address {_address} duplicated"
@@ -117,8 +157,8 @@ class AnkrAPI(object):
         
         return holders
     
-    def get_lp_holders_and_balance(self, chain: Chain, asset: Asset) -> List[Dict[str, str]]:
-        contract_address = ERC20.get_asset(chain, asset).address
-        holders = self.get_token_holders_and_balance(chain, contract_address)
+    def get_lp_holders_and_balance(self, chain: Chain, asset: Asset, raw: bool = False) -> Dict[str, Union[int, float]]:
+        contract_address = lp_registry.address(chain, asset)
+        holders = self.get_token_holders_and_balance(chain, contract_address, raw=raw)
         
         return holders
\ No newline at end of file
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Tuple
+from typing import Dict, List, Optional
 
 from telegram import Update
 from telegram.ext import (Application, CallbackContext, CommandHandler,
@@ -13,9 +14,20 @@ from telegram.ext import (Application, CallbackContext, CommandHandler,
 from .utils import get_assets, prettify_chain
 from ..bot.utils import reply_markdown, reply_message
 from ..constant import Chain, Asset
-from ..erc20 import ERC20
-from ..special_nft.contract import SpecialNFTContract
+from ..erc20 import AsyncERC20, ERC20
+from ..erc20.registry import lp_registry
+from ..erc20.supply_cache import total_supply_cache
+from ..rpc import close_async_clients
+from ..special_nft.service import SpecialNFTService
 from ..price import get_asset_price
+from ..providers import provider_registry
+
+# background total supply refresh, SUPPLY_REFRESH_BLOCKS additionally
+# skips a chain until it advanced that many blocks since the last refresh
+SUPPLY_REFRESH_SECONDS = float(os.getenv("SUPPLY_REFRESH_SECONDS", 60))
+SUPPLY_REFRESH_BLOCKS = int(os.getenv("SUPPLY_REFRESH_BLOCKS")) if os.getenv("SUPPLY_REFRESH_BLOCKS") else None
+# special NFT cache is kept current from Transfer events at this interval
+NFT_REFRESH_SECONDS = float(os.getenv("NFT_REFRESH_SECONDS", 30))
 
 CHAINS = [
     Chain.ARBITRUM_ONE,
@@ -28,40 +40,110 @@ CHAINS = [
 ]
 
 
-def get_lp_summary(chain: Chain, asset: Asset, wallet: str) -> Tuple[Asset, dict]:
-    lp_token = ERC20.get_asset(chain, asset)
-    summary = lp_token.get_summary(wallet)
+def summarize_lp_results(chain: Chain, wallet: str, lp_tokens: Dict[Asset, ERC20], results: dict) -> Dict[Asset, dict]:
+    summaries = dict()
+    for _asset, _lp in lp_tokens.items():
+        _result = results[_lp.address]
+        _balance = _result["balances"][wallet]
+        _total_supply = _result["total_supply"]
+        
+        if _balance is None or _total_supply is None:
+            logging.error(f"Failed to read {_asset} LP on {chain}")
+            continue
+        
+        if _balance <= 0:
+            logging.info(f"Wallet {wallet} doesn't hold any {_asset} LP on {chain}")
+            continue
+        
+        summaries[_asset] = {
+            "balance": _balance / 10**(_lp.decimal),
+            "pct_total_supply": _balance / _total_supply,
+        }
+
+    return summaries
+
+
+def get_chain_lp_summaries(chain: Chain, wallet: str) -> Dict[Asset, dict]:
+    lp_tokens = {_asset: ERC20.get_asset(chain, _asset) for _asset in get_assets(chain)}
+    
+    # read balance and total supply of every LP on this chain in one RPC
+    results = ERC20.batch_read(chain, [_lp.address for _lp in lp_tokens.values()], [wallet])
+    
+    return summarize_lp_results(chain, wallet, lp_tokens, results)
+
 
-    if summary["balance"] <= 0.:
-        logging.info(f"Wallet {wallet} doesn't hold any {asset} LP on {chain}")
-        return None
+async def get_chain_lp_summaries_async(chain: Chain, wallet: str) -> Dict[Asset, dict]:
+    lp_tokens = {_asset: ERC20.get_asset(chain, _asset) for _asset in get_assets(chain)}
+    addresses = [_lp.address for _lp in lp_tokens.values()]
+    
+    # total supply is kept fresh by the bot's background task, only read balanceOf
+    supplies = total_supply_cache.get_fresh(chain, addresses)
+    # decimals are read here too, so summarizing never falls back to a blocking metadata call
+    results, _ = await asyncio.gather(
+        AsyncERC20.batch_read(chain, addresses, [wallet], total_supply=supplies is None),
+        AsyncERC20.load_metadata(chain, addresses)
+    )
+    
+    if supplies is not None:
+        for _address, _entry in supplies.items():
+            results[_address]["total_supply"] = _entry.total_supply
+        _stats = total_supply_cache.stats()[chain]
+        logging.info(f"Using cached total supply on {chain} from block {_stats['block_number']} ({_stats['age']:.1f}s old)")
+    
+    return summarize_lp_results(chain, wallet, lp_tokens, results)
 
-    return asset, summary
+
+async def refresh_lp_supplies(min_blocks: Optional[int] = None) -> None:
+    async def _refresh(chain: Chain) -> None:
+        addresses = [lp_registry.address(chain, _asset) for _asset in get_assets(chain)]
+        await total_supply_cache.refresh(chain, addresses, min_blocks=min_blocks)
+    
+    results = await asyncio.gather(*[_refresh(_chain) for _chain in CHAINS], return_exceptions=True)
+    for _chain, _result in zip(CHAINS, results):
+        if isinstance(_result, Exception):
+            logging.error(f"Failed to refresh total supply on {_chain}: {_result}")
 
 
 def get_lp_balances(wallet: str) -> dict:
     wallet_dict = dict()
 
-    # multiprocess for fast API request
-    with ThreadPoolExecutor(max_workers=10) as executor:
+    # one multicall per chain, chains are queried concurrently
+    with ThreadPoolExecutor(max_workers=len(CHAINS)) as executor:
         future_to_call = {
-            executor.submit(get_lp_summary, _chain, _asset, wallet): (_chain, _asset) 
-            for _chain in CHAINS for _asset in get_assets(_chain)
+            executor.submit(get_chain_lp_summaries, _chain, wallet): _chain 
+            for _chain in CHAINS
         }
 
         for future in as_completed(future_to_call):
-            _chain, _asset = future_to_call[future]
+            _chain = future_to_call[future]
             try:
-                result = future.result()
-                if result:
-                    asset, summary = result
-                    wallet_dict.setdefault(_chain, {})[asset] = summary
+                summaries = future.result()
+                if summaries:
+                    wallet_dict[_chain] = summaries
             except Exception as exc:
-                logging.error(f'{_chain} {_asset} generated an exception: {exc}')
+                logging.error(f'{_chain} generated an exception: {exc}')
         
     return wallet_dict
 
 
+async def get_lp_balances_async(wallet: str) -> dict:
+    """Same as `get_lp_balances` but awaits all chains concurrently without blocking the event loop"""
+    wallet_dict = dict()
+    
+    results = await asyncio.gather(
+        *[get_chain_lp_summaries_async(_chain, wallet) for _chain in CHAINS],
+        return_exceptions=True
+    )
+    
+    for _chain, _result in zip(CHAINS, results):
+        if isinstance(_result, Exception):
+            logging.error(f'{_chain} generated an exception: {_result}')
+        elif _result:
+            wallet_dict[_chain] = _result
+    
+    return wallet_dict
+
+
 def format_dict(wallet: str, lp_balances: dict) -> str:
     """
     Wallet: 0x...
@@ -104,7 +186,7 @@ def format_dict(wallet: str, lp_balances: dict) -> str:
                 _price = get_asset_price(_asset)
             
             chain_lp_price += _price * _bal
-            template += f"\- `{_bal:,.8f} C{_asset.upper()}LP` \(`{_pct_supply:.6f}%` of total supply\)\n"
+            template += f"\- `{_bal:,.8f} {lp_registry.get(_chain, _asset).display_name}` \(`{_pct_supply:.6f}%` of total supply\)\n"
         template += f"\n_Total LP Value: `{chain_lp_price:,.4f} USD`_\n\n"
         
         total_lp_price += chain_lp_price
@@ -119,10 +201,22 @@ class LTFLPBalanceBot(object):
 
     def __init__(
         self, 
+        supply_refresh_seconds: float = SUPPLY_REFRESH_SECONDS,
+        supply_refresh_blocks: Optional[int] = SUPPLY_REFRESH_BLOCKS,
+        nft_refresh_seconds: float = NFT_REFRESH_SECONDS,
     ) -> None:
+        self.supply_refresh_seconds = supply_refresh_seconds
+        self.supply_refresh_blocks = supply_refresh_blocks
+        self.nft_refresh_seconds = nft_refresh_seconds
+        self.background_tasks: List[asyncio.Task] = []
+        
         self.app = Application.builder().token(
             token=os.getenv("TELEGRAM_BOT_TOKEN")
-        ).build()
+        ).post_init(
+            self.init_callback
+        ).post_shutdown(
+            self.shutdown_callback
+        ).concurrent_updates(True).build()
         self.add_default_handler()
         self.add_command_handler("start", LTFLPBalanceBot.start_callback)
         self.add_command_handler("help", LTFLPBalanceBot.start_callback)
@@ -163,8 +257,11 @@ class LTFLPBalanceBot(object):
             
         logging.info(f"Arguments: {args}")
             
-        lp_balances = get_lp_balances(wallet)
-        msg = format_dict(wallet, lp_balances)
+        lp_balances = await get_lp_balances_async(wallet)
+        # price lookup is blocking, keep it off the event loop
+        msg = await asyncio.to_thread(format_dict, wallet, lp_balances)
+        
+        logging.info(f"RPC connection stats: {provider_registry.stats()}")
         
         await reply_markdown(update, msg)
         
@@ -184,7 +281,7 @@ class LTFLPBalanceBot(object):
             
         logging.info(f"Arguments: {args}")
         
-        nft_balance = SpecialNFTContract().balance_of(wallet)
+        nft_balance = await context.bot_data["nft_service"].balance_of(wallet)
         msg = (
             f"Wallet: `{wallet}`\n\n"
             f"Current Special NFT Balance: `{nft_balance}`\n\n"
@@ -197,6 +294,39 @@ class LTFLPBalanceBot(object):
         
         await reply_markdown(update, msg)
 
+    async def init_callback(self, app: Application) -> None:
+        # one NFT service for the lifetime of the bot, shared by all handlers
+        nft_service = SpecialNFTService()
+        app.bot_data["nft_service"] = nft_service
+        
+        self.background_tasks = [
+            asyncio.create_task(self.refresh_supplies_forever()),
+            asyncio.create_task(self.refresh_nft_forever(nft_service)),
+        ]
+    
+    async def shutdown_callback(self, app: Application) -> None:
+        for _task in self.background_tasks:
+            _task.cancel()
+        await close_async_clients()
+        
+    async def refresh_nft_forever(self, nft_service: SpecialNFTService) -> None:
+        while True:
+            try:
+                await nft_service.refresh()
+            except Exception as exc:
+                logging.error(f"Failed to refresh special NFT cache: {exc}")
+            
+            await asyncio.sleep(self.nft_refresh_seconds)
+        
+    async def refresh_supplies_forever(self) -> None:
+        while True:
+            await refresh_lp_supplies(min_blocks=self.supply_refresh_blocks)
+            
+            for _chain, _stats in total_supply_cache.stats().items():
+                logging.info(f"Total supply cache on {_chain}: block {_stats['block_number']}, {_stats['age']:.1f}s old")
+            
+            await asyncio.sleep(self.supply_refresh_seconds)
+
     #### bot functions ####
 
     def add_command_handler(
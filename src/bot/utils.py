@@ -6,6 +6,7 @@ from telegram import Update
 from telegram.error import NetworkError
 
 from ..constant import Asset, Chain
+from ..erc20.registry import lp_registry
 
 
 async def reply_image(update: Update, img_path: str) -> None:
@@ -51,31 +52,8 @@ async def reply_message(update: Update, message: str, do_retry: bool = False) ->
             
             
 def get_assets(chain: Chain) -> List[Asset]:
-    
-    if chain in [Chain.ARBITRUM_ONE, Chain.BNB_CHAIN, Chain.OPTIMISM, Chain.POLYGON, Chain.GNOSIS]:
-        return [Asset.USDT, Asset.USDC, Asset.WETH, Asset.DAI]
-    elif chain == Chain.LINEA:
-        return [Asset.USDT, Asset.USDC, Asset.WETH]
-    elif chain == Chain.METIS:
-        return [Asset.USDT, Asset.USDC, Asset.WETH, Asset.METIS]
-    else:
-        raise ValueError(f"Unknown chain {chain}")
+    return lp_registry.get_assets(chain)
     
     
-def prettify_chain(chain: Chain):
-    if chain == Chain.ARBITRUM_ONE:
-        return "Arbitrum One"
-    elif chain == Chain.OPTIMISM:
-        return "Optimism"
-    elif chain == Chain.POLYGON:
-        return "Polygon Mainnet"
-    elif chain == Chain.BNB_CHAIN:
-        return "BNB Chain"
-    elif chain == Chain.GNOSIS:
-        return "Gnosis Chain"
-    elif chain == Chain.LINEA:
-        return "Linea"
-    elif chain == Chain.METIS:
-        return "Metis"
-    else:
-        raise ValueError(f"Unknown chain {chain}")
+def prettify_chain(chain: Chain) -> str:
+    return lp_registry.prettify_chain(chain)
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+from .constant import Chain
+from .metrics import metrics
+
+# stage tables of every run are kept under this directory
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", "outputs/checkpoints")
+
+
+class CheckpointStore(object):
+    """Parquet tables of each completed stage of a reward run, keyed by run id and snapshot block
+
+    Layout: `{root}/{run_id}/manifest.json` records the snapshot block of each chain and the
+    parameters the stages depend on, run-level stages live in `{root}/{run_id}/{stage}/{name}.parquet`
+    and per-chain stages in `{root}/{run_id}/{chain}@{block}/{stage}/{name}.parquet`.
+
+    Resuming a run with different `params` raises, its stages would silently be stale.
+    """
+
+    def __init__(
+        self,
+        run_id: Optional[str] = None,
+        resume: bool = False,
+        root: str = CHECKPOINT_DIR,
+        params: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.root = root
+        self.resume = resume
+        self.params = dict() if params is None else params
+
+        if run_id is None:
+            # resume the most recent run, otherwise start a new one
+            run_id = self.latest_run_id() if resume else None
+            run_id = datetime.now().strftime("%Y%m%d%H%M%S") if run_id is None else run_id
+        self.run_id = run_id
+
+        self.run_dir = os.path.join(root, run_id)
+        manifest = self.load_manifest()
+        self.snapshot_blocks: Dict[Chain, int] = manifest.get("snapshot_blocks", dict())
+        self.created_at: float = manifest.get("created_at", time.time())
+
+        if len(manifest) > 0 and manifest.get("params_hash") != self.params_hash:
+            changed = sorted(
+                _key for _key in set(self.params) | set(manifest.get("params", dict()))
+                if self.params.get(_key) != manifest.get("params", dict()).get(_key)
+            )
+            raise ValueError(f"Can't resume run {run_id} with different parameters {changed}, start a new run instead")
+
+    @staticmethod
+    def hash_params(params: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+    @property
+    def params_hash(self) -> str:
+        return CheckpointStore.hash_params(self.params)
+
+    def latest_run_id(self) -> Optional[str]:
+        """Most recently created run, custom run ids don't sort by time so their manifests are read"""
+        if not os.path.isdir(self.root):
+            return None
+
+        runs = []
+        for _run_id in os.listdir(self.root):
+            _path = os.path.join(self.root, _run_id, "manifest.json")
+            if not os.path.isfile(_path):
+                continue
+            with open(_path) as fp:
+                # manifests written before created_at was recorded fall back to their mtime
+                _created_at = json.load(fp).get("created_at", os.path.getmtime(_path))
+            runs.append((_created_at, _run_id))
+        return max(runs)[1] if len(runs) > 0 else None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.run_dir, "manifest.json")
+
+    def load_manifest(self) -> Dict:
+        if not self.resume or not os.path.isfile(self.manifest_path):
+            return dict()
+        with open(self.manifest_path) as fp:
+            return json.load(fp)
+
+    def save_manifest(self) -> None:
+        os.makedirs(self.run_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump({
+                "run_id": self.run_id,
+                "created_at": self.created_at,
+                "snapshot_blocks": self.snapshot_blocks,
+                "params": self.params,
+                "params_hash": self.params_hash
+            }, fp, indent=4, default=str)
+        os.replace(tmp_path, self.manifest_path)
+
+    def set_snapshot_blocks(self, resolve: Callable[[Chain], int], chains) -> Dict[Chain, int]:
+        """Pin the snapshot block of `chains`, blocks already recorded by a resumed run are kept"""
+        for _chain in chains:
+            if _chain not in self.snapshot_blocks:
+                self.snapshot_blocks[_chain] = resolve(_chain)
+        self.save_manifest()
+        return self.snapshot_blocks
+
+    def path(self, stage: str, name: str, chain: Optional[Chain] = None) -> str:
+        if chain is None:
+            return os.path.join(self.run_dir, stage, f"{name}.parquet")
+        return os.path.join(self.run_dir, f"{chain}@{self.snapshot_blocks[chain]}", stage, f"{name}.parquet")
+
+    def has(self, stage: str, name: str, chain: Optional[Chain] = None) -> bool:
+        return os.path.isfile(self.path(stage, name, chain))
+
+    def load(self, stage: str, name: str, chain: Optional[Chain] = None) -> pd.DataFrame:
+        return pd.read_parquet(self.path(stage, name, chain))
+
+    def save(self, stage: str, name: str, df: pd.DataFrame, chain: Optional[Chain] = None) -> None:
+        path = self.path(stage, name, chain)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write then rename, a crash mid-write never leaves a half table behind
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def stage(
+        self,
+        stage: str,
+        name: str,
+        compute: Callable[[], pd.DataFrame],
+        chain: Optional[Chain] = None
+    ) -> pd.DataFrame:
+        """Load the stage table when resuming a run that completed it, compute and save it otherwise"""
+        if self.resume and self.has(stage, name, chain):
+            logging.info(f"Skipping {stage} of {name}{'' if chain is None else f' on {chain}'}, loaded from checkpoint")
+            return self.load(stage, name, chain)
+
+        with metrics.stage(stage):
+            df = compute()
+        self.save(stage, name, df, chain)
+        return df
@@ -3,7 +3,7 @@ import os
 
 from covalent import CovalentClient
 
-from ..erc20.contract import ERC20
+from ..erc20.registry import lp_registry
 from ..constant import Asset, Chain
 
 
@@ -39,9 +39,8 @@ class CovalentAPI(object):
     def get_holders(self, chain: Chain, asset: Asset) -> dict:
         chain_name = CovalentAPI.resolve_chain_name(chain)
         
-        lp_token = ERC20.get_asset(chain, asset)
         return asyncio.run(self.get_token_balances_for_wallet_address(
             chain_name=chain_name,
-            token_address=lp_token.address,
+            token_address=lp_registry.address(chain, asset),
             page_size=1000
         ))
\ No newline at end of file
@@ -1,2 +1,3 @@
 from .abi import erc20_abi
+from .async_contract import AsyncERC20
 from .contract import ERC20
\ No newline at end of file
@@ -0,0 +1,31 @@
+from typing import Any, Dict, Sequence
+
+from .contract import ERC20
+from ..constant import Chain
+from ..multicall import AsyncMulticall3
+
+
+class AsyncERC20(object):
+    """Non-blocking counterparts of the `ERC20` batch reads for the bot's event loop"""
+    
+    @staticmethod
+    async def load_metadata(chain: Chain, tokens: Sequence[str]) -> None:
+        missing = ERC20.missing_metadata(chain, tokens)
+        if len(missing) == 0:
+            return
+        
+        results = await AsyncMulticall3(chain).aggregate(ERC20.build_metadata_calls(missing))
+        ERC20.store_metadata(chain, missing, results)
+    
+    @staticmethod
+    async def batch_read(
+        chain: Chain, 
+        tokens: Sequence[str], 
+        wallets: Sequence[str] = (), 
+        total_supply: bool = True, 
+        decimals: bool = False,
+        block_identifier: Any = "latest"
+    ) -> Dict[str, Dict[str, Any]]:
+        calls, keys = ERC20.build_batch_calls(tokens, wallets, total_supply, decimals)
+        results = await AsyncMulticall3(chain).aggregate(calls, block_identifier=block_identifier)
+        return ERC20.parse_batch_results(tokens, keys, results)
@@ -1,19 +1,26 @@
-from web3 import Web3, HTTPProvider
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from web3 import Web3
 
 from .abi import erc20_abi
+from .logs import LogFetcher
+from .metadata import token_metadata_cache
+from .registry import lp_registry
 from ..constant import Asset, Chain
-from ..providers import default_providers
+from ..multicall import Call, Multicall3, decode_result, encode_call, execute_calls
+from ..providers import get_provider
 
 
-class LPNotFoundException(Exception):
-    pass
+_assets: Dict[Tuple[type, Chain, Asset], "ERC20"] = dict()
+_asset_lock = threading.Lock()
 
 
 class ERC20(object):
 
     @staticmethod
     def get_default_provider(chain: Chain) -> Web3:
-        return Web3(HTTPProvider(default_providers[chain]))
+        return get_provider(chain)
 
     def __init__(self, chain: Chain, address: str) -> None:
         self.provider = ERC20.get_default_provider(chain)
@@ -25,19 +32,65 @@ class ERC20(object):
         self.contract = self.provider.eth.contract(
             Web3.to_checksum_address(self.address), abi=erc20_abi)
         
-        # default values
-        self.decimal = self._decimal()
-        self.name = self._name()
-        self.symbol = self._symbol()
+    @property
+    def decimal(self) -> int:
+        return self._metadata("decimals")
     
-    def _name(self) -> str:
-        return self.contract.functions.name().call()
+    @property
+    def name(self) -> str:
+        return self._metadata("name")
     
-    def _symbol(self) -> str:
-        return self.contract.functions.symbol().call()
+    @property
+    def symbol(self) -> str:
+        return self._metadata("symbol")
     
-    def _decimal(self) -> int:
-        return self.contract.functions.decimals().call()
+    def _metadata(self, field: str) -> Any:
+        # metadata is fetched lazily, at most once per token across restarts
+        metadata = token_metadata_cache.get(self.chain, self.address)
+        if metadata is None or field not in metadata:
+            ERC20.load_metadata(self.chain, [self.address])
+            metadata = token_metadata_cache.get(self.chain, self.address)
+        return metadata[field]
+    
+    @staticmethod
+    def load_metadata(chain: Chain, tokens: Sequence[str]) -> None:
+        """Fetch decimals, name and symbol of every uncached token on `chain` in one eth_call"""
+        missing = ERC20.missing_metadata(chain, tokens)
+        if len(missing) == 0:
+            return
+        
+        results = Multicall3(chain).aggregate(ERC20.build_metadata_calls(missing))
+        ERC20.store_metadata(chain, missing, results)
+        
+    @staticmethod
+    def missing_metadata(chain: Chain, tokens: Sequence[str]) -> List[str]:
+        return [
+            Web3.to_checksum_address(_token) for _token in tokens
+            if not token_metadata_cache.is_complete(chain, _token)
+        ]
+    
+    @staticmethod
+    def build_metadata_calls(tokens: Sequence[str]) -> List[Call]:
+        calls = []
+        for _token in tokens:
+            calls.append((_token, encode_call("decimals()")))
+            calls.append((_token, encode_call("name()")))
+            calls.append((_token, encode_call("symbol()")))
+        return calls
+    
+    @staticmethod
+    def store_metadata(chain: Chain, tokens: Sequence[str], results: Sequence[Optional[bytes]]) -> None:
+        for i, _token in enumerate(tokens):
+            _decimals, _name, _symbol = results[3*i:3*i+3]
+            if _decimals is None or _name is None or _symbol is None:
+                raise ValueError(f"{_token} on {chain} is not an ERC20 token")
+            
+            token_metadata_cache.update(
+                chain, _token,
+                decimals=decode_result(["uint8"], _decimals)[0],
+                name=decode_result(["string"], _name)[0],
+                symbol=decode_result(["string"], _symbol)[0]
+            )
     
     def total_supply(self) -> int:
         return self.contract.functions.totalSupply().call()
@@ -46,183 +99,87 @@ class ERC20(object):
         address = Web3.to_checksum_address(address)
         return self.contract.functions.balanceOf(address).call()
     
+    def get_log_fetcher(self, event_name: str = "Transfer", **kwargs: Any) -> LogFetcher:
+        return LogFetcher(self.chain, self.contract, event_name, provider=self.provider, **kwargs)
+    
     def get_summary(self, address: str) -> dict:
-        _balance = self.balance_of(address) / 10**(self.decimal)
-        _total_supply = self.total_supply() / 10**(self.decimal)
+        # balanceOf and totalSupply in a single eth_call
+        result = ERC20.batch_read(self.chain, [self.address], [address])[self.address]
+        
+        _balance = result["balances"][address] / 10**(self.decimal)
+        _total_supply = result["total_supply"] / 10**(self.decimal)
         return {
             "balance": _balance,
             "pct_total_supply": _balance / _total_supply,
         }
+    
+    @staticmethod
+    def batch_read(
+        chain: Chain, 
+        tokens: Sequence[str], 
+        wallets: Sequence[str] = (), 
+        total_supply: bool = True, 
+        decimals: bool = False,
+        block_identifier: Any = "latest",
+        transport: str = "multicall"
+    ) -> Dict[str, Dict[str, Any]]:
+        """Read `balanceOf` of every wallet for every token (plus `totalSupply` and
+        `decimals` if requested) on `chain` through Multicall3 `aggregate3`, or as
+        a JSON-RPC batch of raw `eth_call`s with `transport="batch"`.
         
-    @classmethod
-    def get_asset(cls, chain: Chain, asset: Asset) -> "ERC20":
-        
-        if chain == Chain.ARBITRUM_ONE:
-            if asset == Asset.DAI:
-                return cls(
-                    chain=Chain.ARBITRUM_ONE,
-                    address="0x61B3184be0c95324BF00e0DE12765B5f6Cc6b7cA"
-                )
-            elif asset == Asset.USDC:
-                return cls(
-                    chain=Chain.ARBITRUM_ONE,
-                    address="0xDa492C29D88FfE9B7cbfA6DC068C2f9befaE851b"
-                )
-            elif asset == Asset.USDT:
-                return cls(
-                    chain=Chain.ARBITRUM_ONE,
-                    address="0x45d0736D77A72AE2Bd3c5770878bd85b72895057"
-                )
-            elif asset == Asset.WETH:
-                return cls(
-                    chain=Chain.ARBITRUM_ONE,
-                    address="0xb86AF5eB59A8e871bfA573FA656123ea86F47c3a"
-                )
-            else:
-                raise LPNotFoundException(f"Arbitrum One doesn't support {asset} LP")
-        elif chain == Chain.OPTIMISM:
-            if asset == Asset.WETH:
-                return cls(
-                    chain=Chain.OPTIMISM,
-                    address="0x3C12765d3cFaC132dE161BC6083C886B2Cd94934"
-                )
-            elif asset == Asset.DAI:
-                return cls(
-                    chain=Chain.OPTIMISM,
-                    address="0xeD6d021DcA3d31D63997e4985fa6Eb3A2B745472"
-                )
-            elif asset == Asset.USDC:
-                return cls(
-                    chain=Chain.OPTIMISM,
-                    address="0xB12A1Be740B99D845Af98098965af761be6BD7fE"
-                )
-            elif asset == Asset.USDT:
-                return cls(
-                    chain=Chain.OPTIMISM,
-                    address="0x2C7FA89CC5Ea38d4e5193512b9C10808348Ba74F"
-                )
-            else:
-                raise LPNotFoundException(f"Optimism doesn't support {asset} LP")
-        elif chain == Chain.BNB_CHAIN:
-            if asset == Asset.WETH:
-                return cls(
-                    chain=Chain.BNB_CHAIN,
-                    address="0x223F6A3B8d087741BF99a2531DC53cd15745eBa7"
-                )
-            elif asset == Asset.DAI:
-                return cls(
-                    chain=Chain.BNB_CHAIN,
-                    address="0xf9D88D200f3D9B45Bd9f8f3ae124f59a4fbdbae5"
-                )
-            elif asset == Asset.USDC:
-                return cls(
-                    chain=Chain.BNB_CHAIN,
-                    address="0xc170908481E928DfA39DE3D0d31bEa6292692F8e"
-                )
-            elif asset == Asset.USDT:
-                return cls(
-                    chain=Chain.BNB_CHAIN,
-                    address="0x9350470389848979fCdFEd28352Ff9e0C9Aa87e9"
-                )
-            else:
-                raise LPNotFoundException(f"BNB Chain doesn't support {asset} LP")
-        
-        elif chain == Chain.POLYGON:
-            if asset == Asset.WETH:
-                return cls(
-                    chain=Chain.POLYGON,
-                    address="0xeF1348dAC70e8349513E4Ae7498F302e27102101"
-                )
-            elif asset == Asset.DAI:
-                return cls(
-                    chain=Chain.POLYGON,
-                    address="0xe6228819A3416a256DFEF2568A75737046438cB8"
-                )
-            elif asset == Asset.USDC:
-                return cls(
-                    chain=Chain.POLYGON,
-                    address="0xa03258b76Ef13AF716370529358f6A79eb03ec12"
-                )
-            elif asset == Asset.USDT:
-                return cls(
-                    chain=Chain.POLYGON,
-                    address="0x7F7948B1345b6A95b65a001278b480CE12cA66E5"
-                )
-            else:
-                raise LPNotFoundException(f"Polygon doesn't support {asset} LP")
-        
-        elif chain == Chain.GNOSIS:
-            
-            if asset == Asset.WETH:
-                return cls(
-                    chain=Chain.GNOSIS,
-                    address="0x7aC5bBefAE0459F007891f9Bd245F6beaa91076c"
-                )
-            elif asset == Asset.DAI:
-                return cls(
-                    chain=Chain.GNOSIS,
-                    address="0x98f7656A6C09388c646ff423ED82980675a152dD"
-                )
-            elif asset == Asset.USDC:
-                return cls(
-                    chain=Chain.GNOSIS,
-                    address="0xA639FB3f8C52e10E10a8623616484d41765d5F82"
-                )
-            elif asset == Asset.USDT:
-                return cls(
-                    chain=Chain.GNOSIS,
-                    address="0xD8a772fD2B7872230cCD92EF073bE81De87137D7"
-                )
-            else:
-                raise LPNotFoundException(f"Gnosis doesn't support {asset} LP")
+        Returns a dict keyed by checksum token address, e.g.
+        {token: {"total_supply": int, "decimals": int, "balances": {wallet: int}}}
+        Reverted sub-calls are reported as None.
+        """
+        calls, keys = ERC20.build_batch_calls(tokens, wallets, total_supply, decimals)
+        results = execute_calls(chain, calls, block_identifier, transport)
+        return ERC20.parse_batch_results(tokens, keys, results)
+    
+    @staticmethod
+    def build_batch_calls(
+        tokens: Sequence[str], 
+        wallets: Sequence[str] = (), 
+        total_supply: bool = True, 
+        decimals: bool = False
+    ) -> Tuple[List[Call], List[Tuple[str, str, Optional[str]]]]:
+        # build sub-calls alongside the key each result belongs to
+        calls, keys = [], []
+        for _token in tokens:
+            _token = Web3.to_checksum_address(_token)
+            if decimals:
+                calls.append((_token, encode_call("decimals()")))
+                keys.append((_token, "decimals", None))
+            if total_supply:
+                calls.append((_token, encode_call("totalSupply()")))
+                keys.append((_token, "total_supply", None))
+            for _wallet in wallets:
+                calls.append((_token, encode_call("balanceOf(address)", ["address"], [Web3.to_checksum_address(_wallet)])))
+                keys.append((_token, "balances", _wallet))
         
-        elif chain == Chain.LINEA:
+        return calls, keys
+    
+    @staticmethod
+    def parse_batch_results(
+        tokens: Sequence[str], 
+        keys: Sequence[Tuple[str, str, Optional[str]]], 
+        results: Sequence[Optional[bytes]]
+    ) -> Dict[str, Dict[str, Any]]:
+        output = {Web3.to_checksum_address(_token): {"balances": dict()} for _token in tokens}
+        for (_token, _field, _wallet), _data in zip(keys, results):
+            _value = None if _data is None else decode_result(["uint256"], _data)[0]
             
-            if asset == Asset.WETH:
-                return cls(
-                    chain=Chain.LINEA,
-                    address="0x611C91C807c07B4D358224Fb5Dcd3999f36167B3"
-                )
-            elif asset == Asset.USDC:
-                return cls(
-                    chain=Chain.LINEA,
-                    address="0x66bE8926aa5cbDF24f07560d36999bF9B6B2Bb87"
-                )
-            elif asset == Asset.USDT:
-                return cls(
-                    chain=Chain.LINEA,
-                    address="0xFB8A9F8b13A6D297A1478aF67bDE98362BE532D6"
-                )
+            if _field == "balances":
+                output[_token]["balances"][_wallet] = _value
             else:
-                raise LPNotFoundException(f"Gnosis doesn't support {asset} LP")
+                output[_token][_field] = _value
         
-        elif chain == Chain.METIS:
-            if asset == Asset.WETH:
-                return cls(
-                    chain=Chain.METIS,
-                    address="0x5C70a3ae965cf94ee94b77E620bA425DA33EC187"
-                )
-                
-            elif asset == Asset.USDC:
-                return cls(
-                    chain=Chain.METIS,
-                    address="0x02e226Ed4Ab684Ba421922aa68Af68a7733deadd"
-                )
-                
-            elif asset == Asset.USDT:
-                return cls(
-                    chain=Chain.METIS,
-                    address="0x5f0d5D93F8F3711B5dEba819F824F37675E73Dc2"
-                )
-                
-            elif asset == Asset.METIS:
-                return cls(
-                    chain=Chain.METIS,
-                    address="0xb0419750997c2c9f5e0C5C6d4eb89CFeFB7ca84F"
-                )
-            else:
-                raise LPNotFoundException(f"Metis doesn't support {asset} LP")
+        return output
         
-        else:
-            raise ValueError(f"Unknown chain {chain}")
-        
\ No newline at end of file
+    @classmethod
+    def get_asset(cls, chain: Chain, asset: Asset) -> "ERC20":
+        # contract objects are built once per (chain, asset) and reused
+        key = (cls, chain, asset)
+        with _asset_lock:
+            if key not in _assets:
+                _assets[key] = cls(chain=chain, address=lp_registry.address(chain, asset))
+            return _assets[key]
@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, Optional, Tuple
+
+import requests
+from web3 import Web3
+from web3.contract import Contract
+
+from ..constant import Chain
+from ..providers import get_provider, is_rate_limited
+
+DEFAULT_WORKERS = 4
+DEFAULT_INITIAL_RANGE = 2_000
+DEFAULT_MAX_RANGE = 500_000
+# grow the range while responses hold fewer logs than this
+DEFAULT_TARGET_LOGS = 2_000
+DEFAULT_MAX_RETRIES = 3
+
+# error messages public RPCs use to reject a block range or result set as too large. Kept
+# specific: rate limits and timeouts are retried with backoff, splitting would only add requests
+RANGE_ERROR_HINTS = (
+    "block range",
+    "range too large",
+    "range is too large",
+    "query returned more than",
+    "response size exceeded",
+    "response size should not",
+    "10000 results",
+    "too many logs",
+    "log response size"
+)
+
+
+def is_range_error(exc: Exception) -> bool:
+    if is_rate_limited(exc) or isinstance(exc, requests.Timeout):
+        return False
+    message = str(exc).lower()
+    return any(_hint in message for _hint in RANGE_ERROR_HINTS)
+
+
+def find_deployment_block(provider: Web3, address: str) -> int:
+    """Binary search the first block where `address` has code. Requires an archive node,
+    falls back to the genesis block if the provider can't serve historical state.
+    """
+    low, high = 0, provider.eth.block_number
+    try:
+        while low < high:
+            mid = (low + high) // 2
+            if len(provider.eth.get_code(address, block_identifier=mid)) > 0:
+                high = mid
+            else:
+                low = mid + 1
+    except Exception as exc:
+        logging.warning(f"Failed to locate deployment block of {address}, indexing from genesis: {exc}")
+        return 0
+    
+    return low
+
+
+class LogFetcher(object):
+    """Bulk `eth_getLogs` over a block range with an adaptive range size.
+    
+    Ranges are fetched concurrently by `workers` threads. A range rejected by the
+    provider is halved and retried, and the range grows while responses are small,
+    so each provider settles close to its own limit without hand-tuning.
+    """
+    
+    def __init__(
+        self,
+        chain: Chain,
+        contract: Contract,
+        event_name: str,
+        workers: int = DEFAULT_WORKERS,
+        initial_range: int = DEFAULT_INITIAL_RANGE,
+        max_range: int = DEFAULT_MAX_RANGE,
+        target_logs: int = DEFAULT_TARGET_LOGS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        provider: Optional[Web3] = None
+    ) -> None:
+        self.chain = chain
+        self.provider = get_provider(chain) if provider is None else provider
+        self.address = contract.address
+        self.event = contract.events[event_name]()
+        
+        event_abi = self.event.abi
+        signature = f"{event_name}({','.join(_i['type'] for _i in event_abi['inputs'])})"
+        self.topic = "0x" + bytes(Web3.keccak(text=signature)).hex()
+        
+        self.workers = workers
+        self.max_range = max_range
+        self.target_logs = target_logs
+        self.max_retries = max_retries
+        
+        self._lock = threading.Lock()
+        self.range_size = initial_range
+        
+    def _shrink(self, span: int) -> None:
+        with self._lock:
+            self.range_size = max(1, min(self.range_size, span // 2))
+            logging.debug(f"{self.chain} getLogs range shrunk to {self.range_size} blocks")
+            
+    def _grow(self, span: int, n_logs: int) -> None:
+        if n_logs >= self.target_logs:
+            return
+        with self._lock:
+            self.range_size = min(self.max_range, max(self.range_size, span * 2))
+            
+    def get_logs(self, from_block: int, to_block: int) -> List[Any]:
+        return self.provider.eth.get_logs({
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "address": self.address,
+            "topics": [self.topic]
+        })
+        
+    def fetch_range(self, from_block: int, to_block: int) -> List[Any]:
+        """Fetch all logs in [from_block, to_block], splitting the range whenever the provider rejects it"""
+        span = to_block - from_block + 1
+        
+        for attempt in range(self.max_retries):
+            try:
+                logs = self.get_logs(from_block, to_block)
+                self._grow(span, len(logs))
+                return logs
+            except Exception as exc:
+                if is_range_error(exc) and span > 1:
+                    self._shrink(span)
+                    mid = from_block + span // 2
+                    return self.fetch_range(from_block, mid - 1) + self.fetch_range(mid, to_block)
+                
+                if attempt == self.max_retries - 1:
+                    raise
+                
+                logging.warning(f"getLogs [{from_block}, {to_block}] on {self.chain} failed, retrying: {exc}")
+                time.sleep(2 ** attempt)
+        
+    def iter_ranges(self, from_block: int, to_block: int) -> Iterator[Tuple[int, int, List[Any]]]:
+        """Yield (from_block, to_block, logs) for consecutive ranges covering [from_block, to_block] in block order"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            next_block = from_block
+            
+            while next_block <= to_block or len(pending) > 0:
+                # keep every worker busy with the next range
+                while next_block <= to_block and len(pending) < self.workers:
+                    _end = min(next_block + self.range_size - 1, to_block)
+                    pending.append((next_block, _end, executor.submit(self.fetch_range, next_block, _end)))
+                    next_block = _end + 1
+                
+                _start, _end, _future = pending.popleft()
+                yield _start, _end, _future.result()
+                
+    def iter_logs(self, from_block: int, to_block: int) -> Iterator[Any]:
+        for _, _, _logs in self.iter_ranges(from_block, to_block):
+            yield from _logs
+            
+    def iter_events(self, from_block: int, to_block: int) -> Iterator[Any]:
+        """Decoded events, e.g. `event["args"]["from"]`"""
+        for _log in self.iter_logs(from_block, to_block):
+            yield self.event.process_log(_log)
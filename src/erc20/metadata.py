@@ -0,0 +1,79 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from ..constant import Chain
+
+DEFAULT_CACHE_PATH = ".cache/token_metadata.json"
+METADATA_FIELDS = ("decimals", "name", "symbol")
+
+
+class TokenMetadataCache(object):
+    """Token metadata (decimals, name, symbol) keyed by (chain, address).
+    
+    Metadata never changes once a token is deployed, so entries are kept
+    in-process and mirrored to a JSON file that survives restarts.
+    """
+    
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = os.getenv("TOKEN_METADATA_CACHE", DEFAULT_CACHE_PATH) if path is None else path
+        self._lock = threading.Lock()
+        self._cache = self._load()
+        
+    @staticmethod
+    def key(chain: Chain, address: str) -> str:
+        return f"{chain}:{address.lower()}"
+    
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return dict()
+        
+        try:
+            with open(self.path, "r") as fp:
+                return json.load(fp)
+        except (OSError, ValueError) as exc:
+            logging.warning(f"Ignoring unreadable token metadata cache {self.path}: {exc}")
+            return dict()
+        
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        # write to a temp file first so a crash never leaves a truncated cache
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(self._cache, fp, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        
+    def get(self, chain: Chain, address: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._cache.get(TokenMetadataCache.key(chain, address))
+        
+    def is_complete(self, chain: Chain, address: str) -> bool:
+        entry = self.get(chain, address)
+        return entry is not None and all(_k in entry for _k in METADATA_FIELDS)
+        
+    def seed(self, chain: Chain, address: str, **fields: Any) -> None:
+        """Fill in fields known upfront, in-process only and without overriding cached values"""
+        with self._lock:
+            entry = self._cache.setdefault(TokenMetadataCache.key(chain, address), dict())
+            for _k, _v in fields.items():
+                entry.setdefault(_k, _v)
+        
+    def update(self, chain: Chain, address: str, **fields: Any) -> None:
+        with self._lock:
+            entry = self._cache.setdefault(TokenMetadataCache.key(chain, address), dict())
+            if all(entry.get(_k) == _v for _k, _v in fields.items()):
+                return
+            
+            entry.update(fields)
+            try:
+                self._save()
+            except OSError as exc:
+                logging.warning(f"Failed to persist token metadata cache {self.path}: {exc}")
+
+
+token_metadata_cache = TokenMetadataCache()
@@ -0,0 +1,80 @@
+import json
+import os
+from typing import Dict, List, NamedTuple, Tuple
+
+from .metadata import token_metadata_cache
+from ..constant import Asset, Chain
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(__file__), "lp_tokens.json")
+
+
+class LPNotFoundException(Exception):
+    pass
+
+
+class LPToken(NamedTuple):
+    chain: Chain
+    asset: Asset
+    address: str
+    decimals: int
+    display_name: str
+
+
+class LPTokenRegistry(object):
+    """Connext LP tokens loaded once from `lp_tokens.json`, keyed by (chain, asset).
+    
+    Adding a chain or an asset only requires a new entry in the data file.
+    """
+    
+    def __init__(self, path: str = DEFAULT_REGISTRY_PATH) -> None:
+        with open(path, "r") as fp:
+            data = json.load(fp)
+            
+        self.chain_names: Dict[Chain, str] = dict()
+        self.assets: Dict[Chain, List[Asset]] = dict()
+        self.tokens: Dict[Tuple[Chain, Asset], LPToken] = dict()
+        
+        for _chain, _chain_data in data.items():
+            self.chain_names[_chain] = _chain_data["display_name"]
+            self.assets[_chain] = list(_chain_data["lp_tokens"])
+            
+            for _asset, _token in _chain_data["lp_tokens"].items():
+                self.tokens[(_chain, _asset)] = LPToken(
+                    chain=_chain,
+                    asset=_asset,
+                    address=_token["address"],
+                    decimals=_token["decimals"],
+                    display_name=_token["display_name"]
+                )
+                
+                # decimals are known upfront, no need to ask the chain
+                token_metadata_cache.seed(_chain, _token["address"], decimals=_token["decimals"])
+                
+    def _check_chain(self, chain: Chain) -> None:
+        if chain not in self.chain_names:
+            raise ValueError(f"Unknown chain {chain}")
+    
+    def get(self, chain: Chain, asset: Asset) -> LPToken:
+        self._check_chain(chain)
+        
+        if (chain, asset) not in self.tokens:
+            raise LPNotFoundException(f"{self.chain_names[chain]} doesn't support {asset} LP")
+        
+        return self.tokens[(chain, asset)]
+    
+    def address(self, chain: Chain, asset: Asset) -> str:
+        return self.get(chain, asset).address
+    
+    def get_chains(self) -> List[Chain]:
+        return list(self.chain_names)
+    
+    def get_assets(self, chain: Chain) -> List[Asset]:
+        self._check_chain(chain)
+        return list(self.assets[chain])
+    
+    def prettify_chain(self, chain: Chain) -> str:
+        self._check_chain(chain)
+        return self.chain_names[chain]
+
+
+lp_registry = LPTokenRegistry()
@@ -0,0 +1,97 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Sequence
+
+from web3 import Web3
+
+from .contract import ERC20
+from ..constant import Chain
+from ..multicall import MULTICALL3_ADDRESS, AsyncMulticall3, decode_result, encode_call
+
+# cached supplies older than this are ignored by lookups
+DEFAULT_MAX_AGE = float(os.getenv("SUPPLY_CACHE_MAX_AGE", 300))
+
+
+class SupplyEntry(NamedTuple):
+    total_supply: int
+    block_number: int
+    updated_at: float
+
+
+class TotalSupplyCache(object):
+    """`totalSupply` of tokens keyed by (chain, token), tagged with the block it was read at"""
+    
+    def __init__(self, max_age: float = DEFAULT_MAX_AGE) -> None:
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._cache: Dict[Chain, Dict[str, SupplyEntry]] = dict()
+        
+    def get(self, chain: Chain, token: str) -> Optional[SupplyEntry]:
+        with self._lock:
+            return self._cache.get(chain, dict()).get(Web3.to_checksum_address(token))
+    
+    def get_fresh(self, chain: Chain, tokens: Sequence[str]) -> Optional[Dict[str, SupplyEntry]]:
+        """Return entries of all `tokens` only if every one of them is cached and not expired"""
+        now = time.time()
+        entries = dict()
+        for _token in tokens:
+            _entry = self.get(chain, _token)
+            if _entry is None or now - _entry.updated_at > self.max_age:
+                return None
+            entries[Web3.to_checksum_address(_token)] = _entry
+        return entries
+    
+    def set_many(self, chain: Chain, supplies: Dict[str, int], block_number: int) -> None:
+        now = time.time()
+        with self._lock:
+            chain_cache = self._cache.setdefault(chain, dict())
+            for _token, _supply in supplies.items():
+                chain_cache[Web3.to_checksum_address(_token)] = SupplyEntry(_supply, block_number, now)
+                
+    def block_number(self, chain: Chain) -> Optional[int]:
+        with self._lock:
+            entries = self._cache.get(chain, dict()).values()
+            return min((_e.block_number for _e in entries), default=None)
+                
+    def stats(self) -> Dict[Chain, Dict[str, float]]:
+        """Oldest entry per chain, e.g. {chain: {"block_number": 123, "age": 12.3}}"""
+        now = time.time()
+        with self._lock:
+            return {
+                _chain: {
+                    "block_number": min(_e.block_number for _e in _entries.values()),
+                    "age": max(now - _e.updated_at for _e in _entries.values())
+                }
+                for _chain, _entries in self._cache.items() if len(_entries) > 0
+            }
+    
+    async def refresh(self, chain: Chain, tokens: Sequence[str], min_blocks: Optional[int] = None) -> bool:
+        """Re-read `totalSupply` of `tokens` together with the block number in one multicall.
+        With `min_blocks`, the refresh is skipped until the chain advanced that many blocks.
+        Returns whether the cache was refreshed.
+        """
+        multicall = AsyncMulticall3(chain)
+        
+        cached_block = self.block_number(chain)
+        if min_blocks is not None and cached_block is not None:
+            if await multicall.client.block_number() - cached_block < min_blocks:
+                return False
+        
+        calls, keys = ERC20.build_batch_calls(tokens, total_supply=True)
+        results = await multicall.aggregate([(MULTICALL3_ADDRESS, encode_call("getBlockNumber()"))] + calls)
+        
+        block_number = decode_result(["uint256"], results[0])[0]
+        supplies = {
+            _token: _result["total_supply"]
+            for _token, _result in ERC20.parse_batch_results(tokens, keys, results[1:]).items()
+            if _result["total_supply"] is not None
+        }
+        self.set_many(chain, supplies, block_number)
+        
+        logging.debug(f"Refreshed total supply of {len(supplies)} tokens on {chain} at block {block_number}")
+        return True
+
+
+total_supply_cache = TotalSupplyCache()
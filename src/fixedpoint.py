@@ -0,0 +1,66 @@
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+# token amounts are carried as int64 counts of 10**-FIXED_DECIMALS tokens, enough for
+# ~9.2 billion tokens per value, and converted to decimals only for display
+FIXED_DECIMALS = 9
+
+
+def raw_to_fixed(raw_amounts: Iterable[int], decimals: int) -> np.ndarray:
+    """Raw uint256 token amounts (wei) to fixed-point int64, truncating digits beyond FIXED_DECIMALS"""
+    raw = np.fromiter(raw_amounts, dtype=object)
+    if decimals >= FIXED_DECIMALS:
+        return (raw // 10**(decimals - FIXED_DECIMALS)).astype(np.int64)
+    return (raw * 10**(FIXED_DECIMALS - decimals)).astype(np.int64)
+
+
+def float_to_fixed(amounts) -> np.ndarray:
+    return np.round(np.asarray(amounts, dtype=np.float64) * 10**FIXED_DECIMALS).astype(np.int64)
+
+
+def fixed_to_float(amounts) -> np.ndarray:
+    """Display layer only, every computation stays on the integers"""
+    return np.asarray(amounts, dtype=np.int64) / 10**FIXED_DECIMALS
+
+
+def allocate(total: int, weights: np.ndarray) -> np.ndarray:
+    """Split the integer `total` pro rata to integer `weights` with the largest remainder method,
+    so the shares sum to exactly `total`. Ties go to the earlier weight.
+    """
+    weights = np.asarray(weights, dtype=np.int64)
+    weight_sum = int(weights.sum(dtype=object))
+    if weight_sum == 0:
+        return np.zeros(len(weights), dtype=np.int64)
+
+    # total * weight overflows int64, the products are exact Python integers
+    products = weights.astype(object) * int(total)
+    shares = (products // weight_sum).astype(np.int64)
+    remainders = (products % weight_sum).astype(np.float64)
+
+    # hand out what truncation left over, one unit each, largest remainders first
+    shortfall = int(total) - int(shares.sum())
+    if shortfall > 0:
+        order = np.argsort(-remainders, kind="stable")
+        shares[order[:shortfall]] += 1
+    return shares
+
+
+def fixed_to_raw(amounts, decimals: int) -> np.ndarray:
+    """Fixed-point int64 amounts to exact raw token units (wei) as Python integers"""
+    amounts = np.asarray(amounts, dtype=np.int64).astype(object)
+    if decimals < FIXED_DECIMALS:
+        return amounts // 10**(FIXED_DECIMALS - decimals)
+    return amounts * 10**(decimals - FIXED_DECIMALS)
+
+
+def fixed_to_raw_strings(amounts: pd.Series, decimals: int) -> pd.Series:
+    """Fixed-point int64 amounts to decimal strings of raw token units, for transaction payloads"""
+    amounts = amounts.astype(np.int64)
+    if decimals < FIXED_DECIMALS:
+        return (amounts // 10**(FIXED_DECIMALS - decimals)).astype(str)
+
+    # scaling up is appending zeros, a zero amount stays "0"
+    strings = amounts.astype(str) + "0" * (decimals - FIXED_DECIMALS)
+    return strings.where(amounts != 0, "0")
@@ -0,0 +1 @@
+from .transfer import DEFAULT_CONFIRMATIONS, TransferIndexer
\ No newline at end of file
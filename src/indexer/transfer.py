@@ -0,0 +1,173 @@
+import logging
+import os
+import sqlite3
+from collections import defaultdict
+from typing import Dict, Optional
+
+import pandas as pd
+from web3 import Web3
+
+from ..constant import Chain
+from ..erc20 import ERC20
+from ..erc20.logs import find_deployment_block
+from ..providers import get_provider
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+DEFAULT_INDEXER_DIR = ".cache/indexer"
+# stay behind the head so reorgs don't corrupt the balance table
+DEFAULT_CONFIRMATIONS = 20
+
+
+class TransferIndexer(object):
+    """Balance table of an ERC20 built from its `Transfer` logs.
+    
+    Transfers and balances are stored in a SQLite database per (chain, token)
+    and `sync()` resumes from the last indexed block.
+    """
+    
+    def __init__(
+        self, 
+        chain: Chain, 
+        address: str, 
+        db_path: Optional[str] = None, 
+        confirmations: int = DEFAULT_CONFIRMATIONS
+    ) -> None:
+        self.chain = chain
+        self.address = Web3.to_checksum_address(address)
+        self.provider = get_provider(chain)
+        self.token = ERC20(chain, self.address)
+        self.confirmations = confirmations
+        
+        if db_path is None:
+            indexer_dir = os.getenv("INDEXER_DIR", DEFAULT_INDEXER_DIR)
+            db_path = os.path.join(indexer_dir, f"{chain}_{self.address.lower()}.sqlite")
+        
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self._create_tables()
+        
+    def _create_tables(self) -> None:
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            # uint256 values don't fit SQLite integers, keep them as decimal strings
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS transfers ("
+                "block_number INTEGER NOT NULL, log_index INTEGER NOT NULL, "
+                "sender TEXT NOT NULL, recipient TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (block_number, log_index))"
+            )
+            self.db.execute("CREATE TABLE IF NOT EXISTS balances (wallet TEXT PRIMARY KEY, balance TEXT NOT NULL)")
+            
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+    
+    def _set_meta(self, key: str, value: str) -> None:
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+    
+    def last_block(self) -> Optional[int]:
+        value = self._get_meta("last_block")
+        return None if value is None else int(value)
+    
+    def start_block(self) -> int:
+        value = self._get_meta("start_block")
+        if value is None:
+            value = str(find_deployment_block(self.provider, self.address))
+            with self.db:
+                self._set_meta("start_block", value)
+        return int(value)
+    
+    @staticmethod
+    def parse_log(log: dict) -> tuple:
+        topics = log["topics"]
+        return (
+            log["blockNumber"],
+            log["logIndex"],
+            "0x" + bytes(topics[1])[-20:].hex(),
+            "0x" + bytes(topics[2])[-20:].hex(),
+            int.from_bytes(bytes(log["data"]), "big")
+        )
+        
+    def apply_transfers(self, transfers: list, last_block: int) -> None:
+        """Store `transfers` and their balance deltas, and mark `last_block` as indexed, atomically"""
+        deltas = defaultdict(int)
+        for _, _, _sender, _recipient, _value in transfers:
+            if _sender != ZERO_ADDRESS:
+                deltas[_sender] -= _value
+            if _recipient != ZERO_ADDRESS:
+                deltas[_recipient] += _value
+        
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO transfers (block_number, log_index, sender, recipient, value) VALUES (?, ?, ?, ?, ?)",
+                [(_b, _i, _s, _r, str(_v)) for _b, _i, _s, _r, _v in transfers]
+            )
+            
+            for _wallet, _delta in deltas.items():
+                row = self.db.execute("SELECT balance FROM balances WHERE wallet = ?", (_wallet,)).fetchone()
+                balance = (0 if row is None else int(row[0])) + _delta
+                self.db.execute("INSERT OR REPLACE INTO balances (wallet, balance) VALUES (?, ?)", (_wallet, str(balance)))
+            
+            self._set_meta("last_block", str(last_block))
+    
+    def sync(self, to_block: Optional[int] = None) -> int:
+        """Index all transfers up to `to_block`, capped at the confirmed head. Returns the last indexed block."""
+        confirmed = self.provider.eth.block_number - self.confirmations
+        # blocks are never revisited once indexed, an unconfirmed one would keep a reorged transfer forever
+        to_block = confirmed if to_block is None else min(to_block, confirmed)
+        
+        last_block = self.last_block()
+        from_block = self.start_block() if last_block is None else last_block + 1
+        
+        logging.info(f"Indexing {self.address} transfers on {self.chain} from block {from_block} to {to_block}")
+        
+        if from_block > to_block:
+            return from_block - 1
+        
+        # ranges are streamed in block order, so each one can be committed as it arrives
+        for _, _to_block, _logs in self.token.get_log_fetcher("Transfer").iter_ranges(from_block, to_block):
+            self.apply_transfers([TransferIndexer.parse_log(_log) for _log in _logs], _to_block)
+        
+        return to_block
+    
+    def get_transfers(self, to_block: Optional[int] = None) -> pd.DataFrame:
+        """Indexed transfers up to `to_block` (inclusive) in log order, values as decimal strings"""
+        query = "SELECT block_number, sender, recipient, value FROM transfers"
+        params = ()
+        if to_block is not None:
+            query += " WHERE block_number <= ?"
+            params = (to_block,)
+        return pd.read_sql_query(query + " ORDER BY block_number, log_index", self.db, params=params)
+    
+    def balances(self, block: Optional[int] = None) -> Dict[str, int]:
+        """Raw balance of every wallet holding the token at `block`, the last indexed block by default"""
+        rows = self.db.execute("SELECT wallet, balance FROM balances").fetchall()
+        balances = {_wallet: int(_balance) for _wallet, _balance in rows}
+        
+        # the table is at the last indexed block, undo the transfers after `block`
+        if block is not None:
+            last_block = self.last_block()
+            assert last_block is not None and last_block >= block, f"Block {block} isn't indexed yet, last is {last_block}"
+            rows = self.db.execute(
+                "SELECT sender, recipient, value FROM transfers WHERE block_number > ?", (block,)
+            ).fetchall()
+            for _sender, _recipient, _value in rows:
+                if _sender != ZERO_ADDRESS:
+                    balances[_sender] = balances.get(_sender, 0) + int(_value)
+                if _recipient != ZERO_ADDRESS:
+                    balances[_recipient] = balances.get(_recipient, 0) - int(_value)
+        
+        return {_wallet: _balance for _wallet, _balance in balances.items() if _balance > 0}
+    
+    def get_holders_and_balance(self) -> Dict[str, float]:
+        """Same shape as `AnkrAPI.get_token_holders_and_balance`"""
+        decimal = self.token.decimal
+        return {_wallet: _balance / 10**decimal for _wallet, _balance in self.balances().items()}
+    
+    def close(self) -> None:
+        self.db.close()
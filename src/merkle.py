@@ -0,0 +1,146 @@
+import json
+import os
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from eth_hash.auto import keccak
+
+# abi.encodePacked(uint256 index, address account, uint256 amount)
+LEAF_SIZE = 32 + 20 + 32
+
+
+def hash_rows(rows: np.ndarray) -> np.ndarray:
+    """keccak256 of every row of a (n, width) uint8 array, shaped (n, 32).
+
+    keccak has no batched form here, rows are hashed one by one off a single packed buffer.
+    """
+    data = rows.tobytes()
+    width = rows.shape[1]
+    digests = b"".join(keccak(data[_i:_i + width]) for _i in range(0, len(data), width))
+    return np.frombuffer(digests, dtype=np.uint8).reshape(-1, 32)
+
+
+def encode_leaves(wallets: Sequence[str], amounts: Sequence[int]) -> np.ndarray:
+    """Packed (index, wallet, amount) of every claim, shaped (n, LEAF_SIZE). Index is the row number."""
+    n = len(wallets)
+    packed = np.zeros((n, LEAF_SIZE), dtype=np.uint8)
+
+    # index fits uint64, it goes into the low 8 bytes of its uint256 word
+    packed[:, 24:32] = np.arange(n, dtype=">u8").view(np.uint8).reshape(n, 8)
+    packed[:, 32:52] = np.frombuffer(bytes.fromhex("".join(_w[2:] for _w in wallets)), dtype=np.uint8).reshape(n, 20)
+    packed[:, 52:] = np.frombuffer(b"".join(int(_a).to_bytes(32, "big") for _a in amounts), dtype=np.uint8).reshape(n, 32)
+    return packed
+
+
+def hash_pairs(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """keccak256 of each (left, right) pair in sorted order, as OpenZeppelin `MerkleProof` expects"""
+    rows = np.arange(len(left))
+    # the first differing byte decides the order, equal pairs keep theirs
+    first = (left != right).argmax(axis=1)
+    swap = left[rows, first] > right[rows, first]
+    pairs = np.where(swap[:, None], np.hstack([right, left]), np.hstack([left, right]))
+    return hash_rows(pairs)
+
+
+class MerkleTree(object):
+    """Merkle tree of a Merkle distributor, leaves are keccak256(abi.encodePacked(index, account, amount)).
+
+    Pairs are hashed sorted and an odd node is carried up unchanged, like Uniswap's
+    `MerkleDistributor`. Pairs of a layer are ordered and packed with numpy, then
+    hashed row by row, O(n) hashes overall.
+    """
+
+    def __init__(self, wallets: Sequence[str], amounts: Sequence[int]) -> None:
+        if len(wallets) == 0:
+            raise ValueError("Merkle tree needs at least one leaf")
+
+        self.wallets = list(wallets)
+        self.amounts = [int(_a) for _a in amounts]
+        self.layers: List[np.ndarray] = [hash_rows(encode_leaves(self.wallets, self.amounts))]
+
+        while len(self.layers[-1]) > 1:
+            layer = self.layers[-1]
+            paired = len(layer) // 2 * 2
+            parents = hash_pairs(layer[0:paired:2], layer[1:paired:2])
+            if paired < len(layer):
+                parents = np.vstack([parents, layer[-1:]])
+            self.layers.append(parents)
+
+    @property
+    def root(self) -> str:
+        return "0x" + self.layers[-1][0].tobytes().hex()
+
+    def proof_array(self) -> pa.ListArray:
+        """Proof of every leaf as a list<binary(32)> column, row i is the proof of leaf i"""
+        n = len(self.wallets)
+        positions = np.arange(n)
+        siblings, valid = [], []
+
+        for _layer in self.layers[:-1]:
+            _sibling = positions ^ 1
+            # a carried-up odd node has no sibling on this layer
+            _valid = _sibling < len(_layer)
+            siblings.append(_layer[np.minimum(_sibling, len(_layer) - 1)])
+            valid.append(_valid)
+            positions = positions >> 1
+
+        if len(siblings) == 0:
+            values = np.zeros((0, 32), dtype=np.uint8)
+            counts = np.zeros(n, dtype=np.int32)
+        else:
+            # (n, depth, 32) proof matrix, flattened row-major without the missing siblings
+            matrix = np.stack(siblings, axis=1)
+            mask = np.stack(valid, axis=1)
+            values = matrix[mask]
+            counts = mask.sum(axis=1)
+
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+        hashes = pa.FixedSizeBinaryArray.from_buffers(pa.binary(32), len(values), [None, pa.py_buffer(values.tobytes())])
+        return pa.ListArray.from_arrays(pa.array(offsets), hashes)
+
+    def proof(self, index: int) -> List[str]:
+        proof = []
+        for _layer in self.layers[:-1]:
+            if index ^ 1 < len(_layer):
+                proof.append("0x" + _layer[index ^ 1].tobytes().hex())
+            index >>= 1
+        return proof
+
+    def save(self, path: str, metadata: Dict) -> str:
+        """Write every claim with its proof as a parquet table indexed by leaf, and the root
+        with `metadata` as JSON alongside. Returns the path of the JSON file.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        wallets = bytes.fromhex("".join(_w[2:] for _w in self.wallets))
+        table = pa.table({
+            "index": pa.array(np.arange(len(self.wallets), dtype=np.uint32)),
+            "wallet": pa.FixedSizeBinaryArray.from_buffers(pa.binary(20), len(self.wallets), [None, pa.py_buffer(wallets)]),
+            # uint256 amounts don't fit an integer column, keep them as decimal strings
+            "amount": pa.array([str(_a) for _a in self.amounts]),
+            "proof": self.proof_array()
+        })
+        pq.write_table(table, path, compression="zstd")
+
+        root_path = f"{os.path.splitext(path)[0]}.json"
+        with open(root_path, "w") as fp:
+            json.dump({
+                "merkleRoot": self.root,
+                "tokenTotal": str(sum(self.amounts)),
+                "claims": len(self.wallets),
+                "proofs": os.path.basename(path),
+                **metadata
+            }, fp, indent=4)
+        return root_path
+
+
+def verify_proof(proof: Sequence[str], root: str, index: int, wallet: str, amount: int) -> bool:
+    packed = encode_leaves([wallet], [amount])
+    packed[0, 24:32] = np.array([index], dtype=">u8").view(np.uint8)
+    node = hash_rows(packed)
+    for _sibling in proof:
+        sibling = np.frombuffer(bytes.fromhex(_sibling[2:]), dtype=np.uint8)[None, :]
+        node = hash_pairs(node, sibling)
+    return "0x" + node[0].tobytes().hex() == root.lower()
@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+# upper bounds (seconds) of the request latency histogram buckets, the last one catches the rest
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., float("inf"))
+
+
+class RequestStats(object):
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.seconds = 0.
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+
+    def record(self, seconds: float, sent: int, received: int, ok: bool) -> None:
+        self.requests += 1
+        self.errors += 0 if ok else 1
+        self.bytes_sent += sent
+        self.bytes_received += received
+        self.seconds += seconds
+        self.histogram[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "seconds": self.seconds,
+            "latency_histogram": {
+                ("+Inf" if _bound == float("inf") else str(_bound)): _count
+                for _bound, _count in zip(LATENCY_BUCKETS, self.histogram)
+            }
+        }
+
+
+class StageStats(object):
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.
+        self.max_seconds = 0.
+
+    def record(self, seconds: float) -> None:
+        self.calls += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def to_dict(self) -> Dict:
+        return {"calls": self.calls, "seconds": self.seconds, "max_seconds": self.max_seconds}
+
+
+class Metrics(object):
+    """Process-wide stage timings and outgoing request stats keyed by (service, chain, method).
+
+    Stages that run concurrently (e.g. one per asset) add up, so `seconds` of a stage
+    can exceed the run's wall time, `max_seconds` is its slowest single call.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.stages: Dict[str, StageStats] = dict()
+            self.requests: Dict[Tuple[str, str, str], RequestStats] = dict()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        st = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - st
+            with self._lock:
+                self.stages.setdefault(name, StageStats()).record(seconds)
+
+    def _request_stats(self, service: str, chain: Optional[str], method: str) -> RequestStats:
+        return self.requests.setdefault((service, chain or "-", method), RequestStats())
+
+    def record_request(
+        self,
+        service: str,
+        chain: Optional[str],
+        method: str,
+        seconds: float,
+        sent: int = 0,
+        received: int = 0,
+        ok: bool = True
+    ) -> None:
+        with self._lock:
+            self._request_stats(service, chain, method).record(seconds, sent, received, ok)
+
+    def record_retry(self, service: str, chain: Optional[str], method: str) -> None:
+        with self._lock:
+            self._request_stats(service, chain, method).retries += 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "wall_seconds": time.time() - self.started_at,
+                "stages": {_name: _stats.to_dict() for _name, _stats in self.stages.items()},
+                "requests": [
+                    {"service": _service, "chain": _chain, "method": _method, **_stats.to_dict()}
+                    for (_service, _chain, _method), _stats in sorted(self.requests.items())
+                ]
+            }
+
+    def save(self, path: str, **extra) -> str:
+        """Write the metrics, plus `extra` top-level fields, as JSON to `path`"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as fp:
+            json.dump({**extra, **self.to_dict()}, fp, indent=4)
+        return path
+
+
+metrics = Metrics()
@@ -0,0 +1 @@
+from .contract import MULTICALL3_ADDRESS, AsyncMulticall3, Call, Multicall3, decode_result, encode_call, execute_calls
@@ -0,0 +1,105 @@
+import asyncio
+from typing import Any, List, Optional, Sequence, Tuple
+
+from eth_abi import decode, encode
+from web3 import Web3
+
+from ..constant import Chain
+from ..providers import get_provider
+from ..rpc import BatchRPCClient, get_async_client
+
+# Multicall3 is deployed at the same address on every chain we track
+# https://www.multicall3.com/deployments
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+# maximum number of sub-calls packed into a single aggregate3 eth_call
+MULTICALL_CHUNK_SIZE = 500
+
+# (target, calldata)
+Call = Tuple[str, bytes]
+
+
+def function_selector(signature: str) -> bytes:
+    return Web3.keccak(text=signature)[:4]
+
+
+def encode_call(signature: str, types: Sequence[str] = (), args: Sequence[Any] = ()) -> bytes:
+    """Encode calldata for `signature`, e.g. `encode_call("balanceOf(address)", ["address"], [wallet])`"""
+    return function_selector(signature) + encode(list(types), list(args))
+
+
+def decode_result(types: Sequence[str], data: bytes) -> Tuple[Any, ...]:
+    return decode(list(types), data)
+
+
+class Multicall3(object):
+
+    @staticmethod
+    def get_default_provider(chain: Chain) -> Web3:
+        return get_provider(chain)
+    
+    def __init__(self, chain: Chain, provider: Optional[Web3] = None) -> None:
+        self.chain = chain
+        self.provider = Multicall3.get_default_provider(chain) if provider is None else provider
+        self.address = MULTICALL3_ADDRESS
+        
+    @staticmethod
+    def encode_aggregate3(calls: Sequence[Call]) -> bytes:
+        return encode_call(
+            "aggregate3((address,bool,bytes)[])",
+            ["(address,bool,bytes)[]"],
+            [[(Web3.to_checksum_address(_target), True, _data) for _target, _data in calls]]
+        )
+        
+    @staticmethod
+    def decode_aggregate3(data: bytes) -> List[Optional[bytes]]:
+        results = decode_result(["(bool,bytes)[]"], data)[0]
+        # failed sub-calls are returned as None
+        return [bytes(_data) if _success else None for _success, _data in results]
+    
+    def aggregate(self, calls: Sequence[Call], block_identifier: Any = "latest") -> List[Optional[bytes]]:
+        """Execute all `calls` with one eth_call per `MULTICALL_CHUNK_SIZE` sub-calls.
+        Results are returned in the same order as `calls`.
+        """
+        results = []
+        for i in range(0, len(calls), MULTICALL_CHUNK_SIZE):
+            chunk = calls[i:i+MULTICALL_CHUNK_SIZE]
+            data = self.provider.eth.call(
+                {"to": self.address, "data": Multicall3.encode_aggregate3(chunk)},
+                block_identifier=block_identifier
+            )
+            results.extend(Multicall3.decode_aggregate3(data))
+        
+        return results
+
+
+class AsyncMulticall3(object):
+    
+    def __init__(self, chain: Chain) -> None:
+        self.chain = chain
+        self.client = get_async_client(chain)
+        self.address = MULTICALL3_ADDRESS
+        
+    async def aggregate(self, calls: Sequence[Call], block_identifier: Any = "latest") -> List[Optional[bytes]]:
+        """Async counterpart of `Multicall3.aggregate`, chunks are sent concurrently"""
+        chunks = [calls[i:i+MULTICALL_CHUNK_SIZE] for i in range(0, len(calls), MULTICALL_CHUNK_SIZE)]
+        responses = await asyncio.gather(*[
+            self.client.eth_call(self.address, Multicall3.encode_aggregate3(_chunk), block_identifier)
+            for _chunk in chunks
+        ])
+        
+        results = []
+        for _data in responses:
+            results.extend(Multicall3.decode_aggregate3(_data))
+        
+        return results
+
+
+def execute_calls(chain: Chain, calls: Sequence[Call], block_identifier: Any = "latest", transport: str = "multicall") -> List[Optional[bytes]]:
+    """Run raw `calls` through Multicall3 or as a JSON-RPC batch, failed calls are None either way"""
+    if transport == "multicall":
+        return Multicall3(chain).aggregate(calls, block_identifier=block_identifier)
+    elif transport == "batch":
+        return BatchRPCClient(chain).eth_call_many(calls, block_identifier=block_identifier)
+    else:
+        raise ValueError(f"Unknown transport {transport}")
@@ -0,0 +1,74 @@
+from typing import Sequence
+
+import numpy as np
+from eth_abi import encode
+from web3 import Web3
+
+from .multicall import encode_call
+
+# MultiSendCallOnly v1.3.0, deployed at the same address on every chain we track.
+# The Safe has to DELEGATECALL it (operation 1) so transfers are sent from the Safe.
+# https://github.com/safe-global/safe-deployments
+MULTISEND_CALL_ONLY_ADDRESS = "0x40A2aCCbd92BCA938b02010E17A5b8929b49130D"
+
+TRANSFER_SELECTOR = encode_call("transfer(address,uint256)")
+APPROVE_SELECTOR = encode_call("approve(address,uint256)")
+# selector + address word + amount word, the same for transfer and approve
+TRANSFER_DATA_SIZE = 4 + 32 + 32
+# operation (uint8) + to (address) + value (uint256) + data length (uint256) + data
+PACKED_TRANSFER_SIZE = 1 + 20 + 32 + 32 + TRANSFER_DATA_SIZE
+
+# rough gas of an ERC20 transfer to a holder that had no balance (cold slot, zero to non-zero)
+TRANSFER_GAS = 35_000
+# rough gas of an ERC20 approve setting a zero allowance (cold slot, zero to non-zero)
+APPROVE_GAS = 30_000
+# Safe `execTransaction` with its signature checks plus the MultiSend delegatecall
+BATCH_BASE_GAS = 60_000
+# worst case, every calldata byte non-zero
+CALLDATA_GAS_PER_BYTE = 16
+
+
+def estimate_gas(transfers: int, approvals: int = 0) -> int:
+    """Upper estimate of the gas of a MultiSend of `transfers` ERC20 transfers and `approvals` approves"""
+    return (
+        BATCH_BASE_GAS 
+        + transfers * (TRANSFER_GAS + PACKED_TRANSFER_SIZE * CALLDATA_GAS_PER_BYTE)
+        + approvals * (APPROVE_GAS + PACKED_TRANSFER_SIZE * CALLDATA_GAS_PER_BYTE)
+    )
+
+
+def transfers_per_batch(gas_budget: int, approvals: int = 0) -> int:
+    """Most transfers a batch that also carries `approvals` approves fits in `gas_budget`"""
+    per_transfer = TRANSFER_GAS + PACKED_TRANSFER_SIZE * CALLDATA_GAS_PER_BYTE
+    transfers = (gas_budget - estimate_gas(0, approvals)) // per_transfer
+    if transfers < 1:
+        raise ValueError(f"Gas budget {gas_budget} doesn't fit a single transfer")
+    return transfers
+
+
+def pack_calls(token: str, selector: bytes, accounts: Sequence[str], amounts: Sequence[int]) -> bytes:
+    """MultiSend `transactions` bytes of `token.<selector>(account, amount)` calls, packed in one pass"""
+    n = len(accounts)
+    packed = np.zeros((n, PACKED_TRANSFER_SIZE), dtype=np.uint8)
+
+    # operation 0 (call) and value 0 are already zeros
+    packed[:, 1:21] = np.frombuffer(bytes.fromhex(Web3.to_checksum_address(token)[2:]), dtype=np.uint8)
+    packed[:, 84] = TRANSFER_DATA_SIZE
+    packed[:, 85:89] = np.frombuffer(selector, dtype=np.uint8)
+    packed[:, 101:121] = np.frombuffer(bytes.fromhex("".join(_a[2:] for _a in accounts)), dtype=np.uint8).reshape(n, 20)
+    packed[:, 121:] = np.frombuffer(b"".join(int(_a).to_bytes(32, "big") for _a in amounts), dtype=np.uint8).reshape(n, 32)
+    return packed.tobytes()
+
+
+def pack_transfers(token: str, wallets: Sequence[str], amounts: Sequence[int]) -> bytes:
+    """MultiSend `transactions` bytes of ERC20 transfers of raw `amounts` to `wallets`"""
+    return pack_calls(token, TRANSFER_SELECTOR, wallets, amounts)
+
+
+def pack_approve(token: str, spender: str, amount: int) -> bytes:
+    return pack_calls(token, APPROVE_SELECTOR, [spender], [amount])
+
+
+def encode_multisend(transactions: bytes) -> str:
+    """Calldata of `multiSend(bytes transactions)`"""
+    return "0x" + (encode_call("multiSend(bytes)") + encode(["bytes"], [transactions])).hex()
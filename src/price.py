@@ -1,6 +1,13 @@
+import os
+import time
+
 import requests
 
 from .constant import Asset
+from .metrics import metrics
+from .ratelimit import retry_rate_limited
+
+COINGECKO_API_URL = os.getenv("COINGECKO_API_URL", "https://api.coingecko.com/api/v3")
 
 
 def get_asset_price(asset: Asset) -> float:
@@ -31,7 +38,7 @@ def fetch_coingecko_price(crypto_name: str, days: int = 30):
     :return: Historical price data or None if an error occurs.
     """
     # Endpoint for the CoinGecko API to get historical data
-    url = f"https://api.coingecko.com/api/v3/coins/{crypto_name}/market_chart"
+    url = f"{COINGECKO_API_URL}/coins/{crypto_name}/market_chart"
     
     params = {
         'vs_currency': 'usd',
@@ -39,8 +46,17 @@ def fetch_coingecko_price(crypto_name: str, days: int = 30):
         'interval': 'daily'
     }
 
-    # Make a request to the API
-    response = requests.get(url, params=params)
+    def _send() -> requests.Response:
+        st = time.perf_counter()
+        response = requests.get(url, params=params)
+        metrics.record_request(
+            "coingecko", None, "market_chart", time.perf_counter() - st, 
+            0, len(response.content), ok=response.status_code == 200
+        )
+        return response
+
+    # Make a request to the API, the free tier is rate limited so 429s are retried
+    response = retry_rate_limited(_send, "coingecko", method="market_chart")
     
     if response.status_code == 200:
         return response.json()
@@ -1,12 +1,470 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from web3.providers import JSONBaseProvider
+
 from .constant import Chain
+from .metrics import metrics
+from .ratelimit import RateLimiter, parse_retry_after
 
-# from https://chainlist.org/
+# from https://chainlist.org/, in order of preference
+# override with a comma-separated RPC_URLS_<CHAIN>, e.g. RPC_URLS_OPTIMISM
 default_providers = {
-    Chain.OPTIMISM: "https://1rpc.io/op",
-    Chain.ARBITRUM_ONE: "https://1rpc.io/arb",
-    Chain.BNB_CHAIN: "https://bscrpc.com",
-    Chain.GNOSIS: "https://1rpc.io/gnosis",
-    Chain.POLYGON: "https://polygon.blockpi.network/v1/rpc/public",
-    Chain.LINEA: "https://linea.blockpi.network/v1/rpc/public",
-    Chain.METIS: "https://andromeda.metis.io/?owner=1088"
-}
\ No newline at end of file
+    Chain.OPTIMISM: [
+        "https://1rpc.io/op",
+        "https://mainnet.optimism.io",
+        "https://optimism.publicnode.com"
+    ],
+    Chain.ARBITRUM_ONE: [
+        "https://1rpc.io/arb",
+        "https://arb1.arbitrum.io/rpc",
+        "https://arbitrum-one.publicnode.com"
+    ],
+    Chain.BNB_CHAIN: [
+        "https://bscrpc.com",
+        "https://bsc-dataseed.bnbchain.org",
+        "https://bsc.publicnode.com"
+    ],
+    Chain.GNOSIS: [
+        "https://1rpc.io/gnosis",
+        "https://rpc.gnosischain.com",
+        "https://gnosis.publicnode.com"
+    ],
+    Chain.POLYGON: [
+        "https://polygon.blockpi.network/v1/rpc/public",
+        "https://polygon-rpc.com",
+        "https://polygon-bor.publicnode.com"
+    ],
+    Chain.LINEA: [
+        "https://linea.blockpi.network/v1/rpc/public",
+        "https://rpc.linea.build"
+    ],
+    Chain.METIS: [
+        "https://andromeda.metis.io/?owner=1088",
+        "https://metis-mainnet.public.blastapi.io"
+    ]
+}
+
+# maximum number of requests per JSON-RPC batch, conservative values as
+# public endpoints reject (or silently truncate) oversized batches
+DEFAULT_BATCH_SIZE = 20
+batch_limits = {
+    Chain.OPTIMISM: 50,
+    Chain.ARBITRUM_ONE: 50,
+    Chain.GNOSIS: 50,
+    Chain.BNB_CHAIN: 20,
+    Chain.POLYGON: 10,
+    Chain.LINEA: 10,
+    Chain.METIS: 20
+}
+
+# per-endpoint requests-per-second overrides of RPC_RATE_LIMIT
+rate_limits: Dict[str, float] = dict()
+# extra passes over the endpoints when every one of them answered 429
+MAX_RATE_LIMITED_RETRIES = 3
+
+# maximum number of keep-alive connections kept per chain
+DEFAULT_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE", 10))
+DEFAULT_TIMEOUT = 10
+
+# fire a second request when the primary endpoint is slower than its p95 latency
+DEFAULT_HEDGE = os.getenv("RPC_HEDGE", "false").lower() in ("1", "true", "yes")
+# hedge delay used until an endpoint has enough latency samples
+DEFAULT_HEDGE_DELAY = 1.0
+STATS_WINDOW = 100
+MIN_SAMPLES = 10
+# an endpoint that got no traffic for this long is tried once more, so a demoted one can win back its rank
+PROBE_INTERVAL = float(os.getenv("RPC_PROBE_INTERVAL", 60))
+# metrics label of a request whose caller didn't name its JSON-RPC method
+DEFAULT_METHOD = "unknown"
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status == 429
+    response = getattr(exc, "response", None)
+    return response is not None and response.status_code == 429
+
+
+def get_endpoints(chain: Chain) -> List[str]:
+    override = os.getenv(f"RPC_URLS_{chain.upper()}")
+    if override:
+        return [_url.strip() for _url in override.split(",") if _url.strip()]
+    return list(default_providers[chain])
+
+
+rate_limiter = RateLimiter(limits=rate_limits)
+
+
+class EndpointStats(object):
+    """Rolling latency and error rate of the last `STATS_WINDOW` requests to an endpoint"""
+    
+    def __init__(self, window: int = STATS_WINDOW) -> None:
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.errors = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.last_request_at = 0.
+        
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.last_request_at = time.time()
+            self.errors.append(0 if ok else 1)
+            if ok:
+                self.latencies.append(latency)
+                
+    def record_hedge(self) -> None:
+        with self._lock:
+            self.hedges += 1
+            
+    def claim_probe(self, interval: float = PROBE_INTERVAL) -> bool:
+        """True once per `interval` for an endpoint that was tried before but got no traffic since"""
+        with self._lock:
+            if self.requests == 0 or time.time() - self.last_request_at < interval:
+                return False
+            # counts as traffic so concurrent callers don't all probe it, and the stale
+            # window is dropped so the probe's own result decides the rank
+            self.last_request_at = time.time()
+            self.latencies.clear()
+            self.errors.clear()
+            return True
+                
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self.latencies) < MIN_SAMPLES:
+                return None
+            latencies = sorted(self.latencies)
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+    
+    def error_rate(self) -> float:
+        with self._lock:
+            return sum(self.errors) / len(self.errors) if len(self.errors) > 0 else 0.
+        
+    def score(self) -> float:
+        """Lower is better, untried endpoints score 0 so each one gets sampled"""
+        with self._lock:
+            if len(self.errors) == 0:
+                return 0.
+            mean_latency = sum(self.latencies) / len(self.latencies) if len(self.latencies) > 0 else DEFAULT_TIMEOUT
+        return mean_latency * (1 + 10 * self.error_rate())
+
+
+class EndpointPool(object):
+    """All RPC endpoints of a chain, ranked by rolling latency and error rate.
+    
+    Requests go to the best endpoint and fail over to the next one on transport
+    errors. Every request first takes a token from the endpoint's bucket in
+    `limiter`, and a 429 blocks that bucket for the `Retry-After` period.
+    With `hedge`, a second request is fired at the runner-up when the primary
+    hasn't answered within its p95 latency, and the first answer wins.
+    JSON-RPC level errors (e.g. reverts) are returned as-is, not failed over.
+    """
+    
+    def __init__(
+        self, 
+        chain: Chain, 
+        endpoints: List[str], 
+        session: requests.Session, 
+        timeout: float = DEFAULT_TIMEOUT, 
+        hedge: bool = DEFAULT_HEDGE,
+        limiter: Optional[RateLimiter] = None
+    ) -> None:
+        self.chain = chain
+        self.endpoints = endpoints
+        self.session = session
+        self.timeout = timeout
+        self.hedge = hedge
+        self.limiter = rate_limiter if limiter is None else limiter
+        
+        self._stats = {_endpoint: EndpointStats() for _endpoint in endpoints}
+        self._executor = ThreadPoolExecutor(max_workers=DEFAULT_POOL_SIZE) if hedge else None
+        
+    def ranked(self) -> List[str]:
+        # rate-limited endpoints go last, stable sort keeps the configured order on ties
+        blocked = {_endpoint: self.limiter.blocked_for(_endpoint) > 0 for _endpoint in self.endpoints}
+        endpoints = sorted(self.endpoints, key=lambda _endpoint: (blocked[_endpoint], self._stats[_endpoint].score()))
+        
+        # a demoted endpoint's stats only change when it's used, send it a request now and then
+        for _endpoint in endpoints[1:]:
+            if not blocked[_endpoint] and self._stats[_endpoint].claim_probe():
+                logging.debug(f"Probing {_endpoint} on {self.chain}")
+                endpoints.remove(_endpoint)
+                return [_endpoint] + endpoints
+        return endpoints
+    
+    def hedge_delay(self, endpoint: str) -> float:
+        p95 = self._stats[endpoint].percentile(0.95)
+        return DEFAULT_HEDGE_DELAY if p95 is None else p95
+    
+    def _record(self, endpoint: str, method: str, seconds: float, sent: bytes, received: bytes, ok: bool) -> None:
+        self._stats[endpoint].record(seconds, ok=ok)
+        metrics.record_request("rpc", self.chain, method, seconds, len(sent), len(received), ok=ok)
+    
+    def _send(self, endpoint: str, data: bytes, method: str = DEFAULT_METHOD) -> bytes:
+        self.limiter.acquire(endpoint)
+        
+        st = time.perf_counter()
+        try:
+            r = self.session.post(
+                endpoint, 
+                data=data, 
+                headers={"Content-Type": "application/json"}, 
+                timeout=self.timeout
+            )
+            if r.status_code == 429:
+                self.limiter.block(endpoint, parse_retry_after(r.headers.get("Retry-After")))
+            r.raise_for_status()
+        except requests.RequestException:
+            self._record(endpoint, method, time.perf_counter() - st, data, b"", ok=False)
+            raise
+        
+        self._record(endpoint, method, time.perf_counter() - st, data, r.content, ok=True)
+        return r.content
+    
+    def _failover(self, endpoints: List[str], data: bytes, method: str = DEFAULT_METHOD) -> bytes:
+        last_exc = None
+        for _ in range(MAX_RATE_LIMITED_RETRIES + 1):
+            all_rate_limited = True
+            for _endpoint in endpoints:
+                if last_exc is not None:
+                    metrics.record_retry("rpc", self.chain, method)
+                try:
+                    return self._send(_endpoint, data, method)
+                except requests.RequestException as exc:
+                    logging.warning(f"RPC {_endpoint} on {self.chain} failed, trying next endpoint: {exc}")
+                    last_exc = exc
+                    all_rate_limited = all_rate_limited and is_rate_limited(exc)
+            
+            # only retry when throttled, the buckets wait out Retry-After
+            if not all_rate_limited:
+                break
+            endpoints = self.ranked()
+        raise last_exc
+    
+    def _hedged(self, endpoints: List[str], data: bytes, method: str = DEFAULT_METHOD) -> bytes:
+        primary, secondary = endpoints[0], endpoints[1]
+        futures = {self._executor.submit(self._send, primary, data, method): primary}
+        
+        done, _ = wait(futures, timeout=self.hedge_delay(primary))
+        if len(done) == 0:
+            self._stats[primary].record_hedge()
+            metrics.record_retry("rpc", self.chain, method)
+            futures[self._executor.submit(self._send, secondary, data, method)] = secondary
+        
+        # first successful answer wins
+        last_exc, pending = None, set(futures)
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for _future in done:
+                if _future.exception() is None:
+                    return _future.result()
+                last_exc = _future.exception()
+        
+        remaining = [_endpoint for _endpoint in endpoints if _endpoint not in futures.values()]
+        if len(remaining) == 0:
+            raise last_exc
+        return self._failover(remaining, data, method)
+    
+    def post(self, data: bytes, method: str = DEFAULT_METHOD) -> bytes:
+        """POST a JSON-RPC body and return the raw response body, `method` labels its metrics"""
+        endpoints = self.ranked()
+        if self.hedge and len(endpoints) > 1:
+            return self._hedged(endpoints, data, method)
+        return self._failover(endpoints, data, method)
+    
+    async def _asend(self, session: aiohttp.ClientSession, endpoint: str, data: bytes, method: str = DEFAULT_METHOD) -> bytes:
+        await self.limiter.acquire_async(endpoint)
+        
+        st = time.perf_counter()
+        try:
+            async with session.post(endpoint, data=data, headers={"Content-Type": "application/json"}) as r:
+                if r.status == 429:
+                    self.limiter.block(endpoint, parse_retry_after(r.headers.get("Retry-After")))
+                r.raise_for_status()
+                content = await r.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self._record(endpoint, method, time.perf_counter() - st, data, b"", ok=False)
+            raise
+        
+        self._record(endpoint, method, time.perf_counter() - st, data, content, ok=True)
+        return content
+    
+    async def _afailover(
+        self, 
+        session: aiohttp.ClientSession, 
+        endpoints: List[str], 
+        data: bytes, 
+        method: str = DEFAULT_METHOD
+    ) -> bytes:
+        last_exc = None
+        for _ in range(MAX_RATE_LIMITED_RETRIES + 1):
+            all_rate_limited = True
+            for _endpoint in endpoints:
+                if last_exc is not None:
+                    metrics.record_retry("rpc", self.chain, method)
+                try:
+                    return await self._asend(session, _endpoint, data, method)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                    logging.warning(f"RPC {_endpoint} on {self.chain} failed, trying next endpoint: {exc!r}")
+                    last_exc = exc
+                    all_rate_limited = all_rate_limited and is_rate_limited(exc)
+            
+            if not all_rate_limited:
+                break
+            endpoints = self.ranked()
+        raise last_exc
+    
+    async def apost(self, session: aiohttp.ClientSession, data: bytes, method: str = DEFAULT_METHOD) -> bytes:
+        """Async counterpart of `post` on an aiohttp session"""
+        endpoints = self.ranked()
+        if not self.hedge or len(endpoints) < 2:
+            return await self._afailover(session, endpoints, data, method)
+        
+        primary, secondary = endpoints[0], endpoints[1]
+        tasks = {asyncio.ensure_future(self._asend(session, primary, data, method)): primary}
+        
+        done, _ = await asyncio.wait(set(tasks), timeout=self.hedge_delay(primary))
+        if len(done) == 0:
+            self._stats[primary].record_hedge()
+            metrics.record_retry("rpc", self.chain, method)
+            tasks[asyncio.ensure_future(self._asend(session, secondary, data, method))] = secondary
+        
+        last_exc, pending = None, set(tasks)
+        while len(pending) > 0:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for _task in done:
+                if _task.exception() is None:
+                    for _other in pending:
+                        _other.cancel()
+                    return _task.result()
+                last_exc = _task.exception()
+        
+        remaining = [_endpoint for _endpoint in endpoints if _endpoint not in tasks.values()]
+        if len(remaining) == 0:
+            raise last_exc
+        return await self._afailover(session, remaining, data, method)
+    
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            _endpoint: {
+                "requests": _stats.requests,
+                "p50": _stats.percentile(0.5),
+                "p95": _stats.percentile(0.95),
+                "error_rate": _stats.error_rate(),
+                "hedges": _stats.hedges
+            }
+            for _endpoint, _stats in self._stats.items()
+        }
+
+
+class PooledHTTPProvider(JSONBaseProvider):
+    """JSON-RPC over HTTP through a chain's `EndpointPool`.
+    
+    web3's own `HTTPProvider` caches one session per thread, so every worker
+    of a `ThreadPoolExecutor` pays for its own TCP+TLS handshake. This provider
+    sends all requests of a chain through the same connection pool instead.
+    """
+    
+    def __init__(self, pool: EndpointPool) -> None:
+        super().__init__()
+        self.pool = pool
+        
+    def __str__(self) -> str:
+        return f"PooledHTTPProvider({self.pool.chain})"
+        
+    def make_request(self, method, params):
+        return self.decode_rpc_response(self.pool.post(self.encode_rpc_request(method, params), method))
+
+
+class ProviderRegistry(object):
+    """One pooled keep-alive session, endpoint pool and `Web3` instance per chain, safe to share across threads"""
+    
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT, hedge: bool = DEFAULT_HEDGE) -> None:
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.hedge = hedge
+        
+        self._lock = threading.Lock()
+        self._sessions: Dict[Chain, requests.Session] = dict()
+        self._pools: Dict[Chain, EndpointPool] = dict()
+        self._providers: Dict[Chain, Web3] = dict()
+        
+    def session(self, chain: Chain) -> requests.Session:
+        with self._lock:
+            if chain not in self._sessions:
+                # one pool per endpoint host, each kept at `pool_size` connections
+                adapter = HTTPAdapter(pool_connections=len(get_endpoints(chain)), pool_maxsize=self.pool_size)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[chain] = session
+            return self._sessions[chain]
+        
+    def pool(self, chain: Chain) -> EndpointPool:
+        session = self.session(chain)
+        with self._lock:
+            if chain not in self._pools:
+                self._pools[chain] = EndpointPool(chain, get_endpoints(chain), session, self.timeout, self.hedge)
+            return self._pools[chain]
+        
+    def get(self, chain: Chain) -> Web3:
+        pool = self.pool(chain)
+        with self._lock:
+            if chain not in self._providers:
+                self._providers[chain] = Web3(PooledHTTPProvider(pool))
+            return self._providers[chain]
+        
+    def stats(self, chain: Optional[Chain] = None) -> Dict[Chain, Dict[str, int]]:
+        """Per-chain connection reuse and endpoint scores, 
+        e.g. {chain: {"requests": 120, "connections": 3, "reused": 117, "endpoints": {...}}}
+        """
+        with self._lock:
+            sessions = dict(self._sessions) if chain is None else {chain: self._sessions[chain]}
+            pools = dict(self._pools)
+        
+        output = dict()
+        for _chain, _session in sessions.items():
+            _requests, _connections = 0, 0
+            for _adapter in set(_session.adapters.values()):
+                _pools = _adapter.poolmanager.pools
+                for _key in _pools.keys():
+                    _pool = _pools[_key]
+                    _requests += _pool.num_requests
+                    _connections += _pool.num_connections
+            
+            output[_chain] = {
+                "requests": _requests,
+                "connections": _connections,
+                "reused": max(_requests - _connections, 0)
+            }
+            if _chain in pools:
+                output[_chain]["endpoints"] = pools[_chain].stats()
+        
+        return output
+    
+    def close(self) -> None:
+        with self._lock:
+            for _session in self._sessions.values():
+                _session.close()
+            self._sessions.clear()
+            self._pools.clear()
+            self._providers.clear()
+
+
+provider_registry = ProviderRegistry()
+
+
+def get_provider(chain: Chain) -> Web3:
+    return provider_registry.get(chain)
@@ -0,0 +1,206 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import requests
+
+from .metrics import metrics
+
+# requests per second allowed per RPC endpoint, shared by every caller in the process
+DEFAULT_RATE_LIMIT = float(os.getenv("RPC_RATE_LIMIT", 10))
+# set to share the budget between processes through lock files in this directory
+RATE_LIMIT_DIR = os.getenv("RPC_RATE_LIMIT_DIR")
+# attempts of a rate-limited HTTP API call (Ankr, CoinGecko) before giving up
+DEFAULT_HTTP_RETRIES = 5
+
+
+def parse_retry_after(value: Optional[str], default: float = 1.) -> float:
+    """Seconds to wait from a `Retry-After` header, given either as seconds or an HTTP date"""
+    if value is None:
+        return default
+    try:
+        return max(float(value), 0.)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.)
+    except (TypeError, ValueError):
+        return default
+
+
+def retry_rate_limited(
+    send: Callable[[], requests.Response],
+    service: str,
+    chain: Optional[str] = None,
+    method: str = "unknown",
+    retries: int = DEFAULT_HTTP_RETRIES
+) -> requests.Response:
+    """Call `send` again while it's answered with 429, waiting for its `Retry-After` or an exponential backoff.
+    The last response is returned either way, callers check its status as before.
+    """
+    r = send()
+    for _attempt in range(retries - 1):
+        if r.status_code != 429:
+            break
+        delay = parse_retry_after(r.headers.get("Retry-After"), default=2. ** _attempt)
+        logging.warning(f"{service} {method} rate limited, retrying in {delay:.2f} seconds")
+        metrics.record_retry(service, chain, method)
+        time.sleep(delay)
+        r = send()
+    return r
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket. `rate` tokens are added per second up to `capacity`.
+    
+    Callers reserve a token and sleep for the returned delay, so concurrent
+    callers queue up instead of all retrying at once.
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        
+        self._lock = threading.Lock()
+        self._state = {"tokens": self.capacity, "updated_at": time.time(), "blocked_until": 0.}
+        
+    def _reserve(self, state: Dict[str, float]) -> float:
+        now = time.time()
+        state["tokens"] = min(self.capacity, state["tokens"] + (now - state["updated_at"]) * self.rate)
+        state["updated_at"] = now
+        
+        # tokens may go negative, which queues later callers behind this one
+        state["tokens"] -= 1
+        wait = 0. if state["tokens"] >= 0 else -state["tokens"] / self.rate
+        return max(wait, state["blocked_until"] - now)
+    
+    def reserve(self) -> float:
+        """Take a token and return how long to wait before using it"""
+        with self._lock:
+            return self._reserve(self._state)
+        
+    def block(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds`, e.g. after a 429 with `Retry-After`"""
+        with self._lock:
+            self._state["blocked_until"] = max(self._state["blocked_until"], time.time() + seconds)
+            
+    def blocked_for(self) -> float:
+        with self._lock:
+            return max(self._state["blocked_until"] - time.time(), 0.)
+            
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+            
+    async def acquire_async(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class FileTokenBucket(TokenBucket):
+    """`TokenBucket` whose state lives in a lock file, so the budget is shared across processes"""
+    
+    def __init__(self, path: str, rate: float, capacity: Optional[float] = None) -> None:
+        super().__init__(rate, capacity)
+        self.path = path
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            
+    def _update(self, fn):
+        with self._lock, open(self.path, "a+") as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                fp.seek(0)
+                content = fp.read()
+                state = json.loads(content) if content else dict(self._state)
+                
+                result = fn(state)
+                
+                fp.seek(0)
+                fp.truncate()
+                json.dump(state, fp)
+                fp.flush()
+                return result
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+                
+    def _read(self) -> Dict[str, float]:
+        # shared lock and no write-back, readers don't serialize on each other
+        try:
+            with open(self.path, "r") as fp:
+                fcntl.flock(fp, fcntl.LOCK_SH)
+                try:
+                    content = fp.read()
+                finally:
+                    fcntl.flock(fp, fcntl.LOCK_UN)
+        except FileNotFoundError:
+            content = ""
+        return json.loads(content) if content else dict(self._state)
+    
+    def reserve(self) -> float:
+        return self._update(self._reserve)
+    
+    async def acquire_async(self) -> None:
+        # the flock and file write would stall the event loop, reserve on a worker thread
+        wait = await asyncio.get_running_loop().run_in_executor(None, self.reserve)
+        if wait > 0:
+            await asyncio.sleep(wait)
+    
+    def block(self, seconds: float) -> None:
+        def _block(state):
+            state["blocked_until"] = max(state["blocked_until"], time.time() + seconds)
+        self._update(_block)
+        
+    def blocked_for(self) -> float:
+        return max(self._read()["blocked_until"] - time.time(), 0.)
+
+
+class RateLimiter(object):
+    """One token bucket per endpoint. `limits` overrides `default_rate` for specific endpoints."""
+    
+    def __init__(
+        self, 
+        default_rate: float = DEFAULT_RATE_LIMIT, 
+        limits: Optional[Dict[str, float]] = None, 
+        shared_dir: Optional[str] = RATE_LIMIT_DIR
+    ) -> None:
+        self.default_rate = default_rate
+        self.limits = dict() if limits is None else limits
+        self.shared_dir = shared_dir
+        
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = dict()
+        
+    def bucket(self, endpoint: str) -> TokenBucket:
+        with self._lock:
+            if endpoint not in self._buckets:
+                rate = self.limits.get(endpoint, self.default_rate)
+                if self.shared_dir is None:
+                    self._buckets[endpoint] = TokenBucket(rate)
+                else:
+                    name = hashlib.sha1(endpoint.encode()).hexdigest()
+                    self._buckets[endpoint] = FileTokenBucket(os.path.join(self.shared_dir, f"{name}.json"), rate)
+            return self._buckets[endpoint]
+    
+    def acquire(self, endpoint: str) -> None:
+        self.bucket(endpoint).acquire()
+        
+    async def acquire_async(self, endpoint: str) -> None:
+        await self.bucket(endpoint).acquire_async()
+        
+    def block(self, endpoint: str, seconds: float) -> None:
+        self.bucket(endpoint).block(seconds)
+        
+    def blocked_for(self, endpoint: str) -> float:
+        return self.bucket(endpoint).blocked_for()
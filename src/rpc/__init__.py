@@ -0,0 +1,3 @@
+from .async_client import AsyncRPCClient, close_async_clients, get_async_client
+from .batch import BatchRPCClient
+from .errors import RPCError
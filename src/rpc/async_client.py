@@ -0,0 +1,85 @@
+import asyncio
+import itertools
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from .errors import RPCError
+from ..constant import Chain
+from ..providers import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, provider_registry
+
+
+class AsyncRPCClient(object):
+    """Minimal JSON-RPC client over aiohttp for use inside the bot's event loop"""
+    
+    def __init__(
+        self, 
+        chain: Chain, 
+        pool_size: int = DEFAULT_POOL_SIZE, 
+        timeout: float = DEFAULT_TIMEOUT
+    ) -> None:
+        self.chain = chain
+        # endpoint ranking and failover are shared with the sync provider
+        self.pool = provider_registry.pool(chain)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        
+        self._ids = itertools.count()
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+    def session(self) -> aiohttp.ClientSession:
+        # created lazily as aiohttp sessions are bound to the running loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+    
+    async def request(self, method: str, params: List[Any]) -> Any:
+        body = {"jsonrpc": "2.0", "method": method, "params": params, "id": next(self._ids)}
+        response = json.loads(await self.pool.apost(self.session(), json.dumps(body).encode(), method))
+        
+        if "error" in response:
+            raise RPCError(f"{self.chain} {method} failed: {response['error']}")
+        
+        return response["result"]
+    
+    async def eth_call(self, to: str, data: bytes, block_identifier: Any = "latest") -> bytes:
+        if isinstance(block_identifier, int):
+            block_identifier = hex(block_identifier)
+        result = await self.request("eth_call", [{"to": to, "data": "0x" + data.hex()}, block_identifier])
+        return bytes.fromhex(result[2:])
+    
+    async def get_logs(self, address: str, topics: List[Any], from_block: int, to_block: int) -> List[dict]:
+        return await self.request("eth_getLogs", [{
+            "fromBlock": hex(from_block),
+            "toBlock": hex(to_block),
+            "address": address,
+            "topics": topics
+        }])
+    
+    async def block_number(self) -> int:
+        return int(await self.request("eth_blockNumber", []), 16)
+    
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+# one client per (chain, event loop)
+_clients: Dict[Tuple[Chain, int], AsyncRPCClient] = dict()
+
+
+def get_async_client(chain: Chain) -> AsyncRPCClient:
+    key = (chain, id(asyncio.get_running_loop()))
+    if key not in _clients:
+        _clients[key] = AsyncRPCClient(chain)
+    return _clients[key]
+
+
+async def close_async_clients() -> None:
+    loop_id = id(asyncio.get_running_loop())
+    for _key in [_k for _k in _clients if _k[1] == loop_id]:
+        await _clients.pop(_key).close()
@@ -0,0 +1,77 @@
+import itertools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Sequence, Tuple
+
+from .errors import RPCError
+from ..constant import Chain
+from ..providers import DEFAULT_BATCH_SIZE, batch_limits, provider_registry
+
+# number of batches in flight at once
+DEFAULT_BATCH_WORKERS = 4
+
+
+class BatchRPCClient(object):
+    """Send many JSON-RPC requests as array bodies, one HTTP POST per batch.
+    
+    Batches are split according to the chain's limit in `batch_limits` and sent
+    through the chain's endpoint pool. Responses are matched back by id.
+    """
+    
+    def __init__(self, chain: Chain, batch_size: Optional[int] = None, workers: int = DEFAULT_BATCH_WORKERS) -> None:
+        self.chain = chain
+        self.pool = provider_registry.pool(chain)
+        self.batch_size = batch_limits.get(chain, DEFAULT_BATCH_SIZE) if batch_size is None else batch_size
+        self.workers = workers
+        
+        self._ids = itertools.count()
+        
+    def _post(self, batch: List[dict]) -> List[dict]:
+        # batches are homogeneous in practice, label them by their first method
+        method = f"batch:{batch[0]['method']}"
+        responses = json.loads(self.pool.post(json.dumps(batch).encode(), method))
+        # some providers answer a rejected batch with a single error object
+        if not isinstance(responses, list):
+            raise RPCError(f"{self.chain} rejected batch of {len(batch)} requests: {responses}")
+        
+        by_id = {_response.get("id"): _response for _response in responses}
+        missing = [_request["id"] for _request in batch if _request["id"] not in by_id]
+        if len(missing) > 0:
+            raise RPCError(f"{self.chain} dropped {len(missing)} of {len(batch)} batched requests")
+        
+        return [by_id[_request["id"]] for _request in batch]
+    
+    def request_many(self, requests: Sequence[Tuple[str, list]], raise_on_error: bool = True) -> List[Any]:
+        """Results of `requests` given as (method, params), in order.
+        With `raise_on_error=False` failed requests are returned as None.
+        """
+        body = [
+            {"jsonrpc": "2.0", "method": _method, "params": _params, "id": next(self._ids)}
+            for _method, _params in requests
+        ]
+        batches = [body[i:i+self.batch_size] for i in range(0, len(body), self.batch_size)]
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            responses = [_r for _batch in executor.map(self._post, batches) for _r in _batch]
+        
+        results = []
+        for _response in responses:
+            if "error" in _response:
+                if raise_on_error:
+                    raise RPCError(f"{self.chain} batched request failed: {_response['error']}")
+                results.append(None)
+            else:
+                results.append(_response["result"])
+        
+        return results
+    
+    def eth_call_many(self, calls: Sequence[Tuple[str, bytes]], block_identifier: Any = "latest") -> List[Optional[bytes]]:
+        """Raw `eth_call`s given as (to, calldata), reverted calls are returned as None like Multicall3 does"""
+        if isinstance(block_identifier, int):
+            block_identifier = hex(block_identifier)
+        
+        results = self.request_many(
+            [("eth_call", [{"to": _to, "data": "0x" + _data.hex()}, block_identifier]) for _to, _data in calls],
+            raise_on_error=False
+        )
+        return [None if _result is None else bytes.fromhex(_result[2:]) for _result in results]
@@ -0,0 +1,2 @@
+class RPCError(Exception):
+    pass
\ No newline at end of file
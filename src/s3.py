@@ -0,0 +1,166 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from .metrics import metrics
+
+# e.g. a local S3 stand-in such as `benchmarks.fake_server` or MinIO, unset for AWS
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", None)
+# files uploaded at once in the background
+DEFAULT_UPLOAD_WORKERS = int(os.getenv("S3_UPLOAD_WORKERS", 4))
+
+# files larger than this are sent as concurrent multipart uploads
+MULTIPART_THRESHOLD = 8 * 1024**2
+MULTIPART_CHUNKSIZE = 8 * 1024**2
+MULTIPART_CONCURRENCY = 8
+
+# with `compress`, text outputs are stored gzipped under their key plus ".gz"
+GZIP_EXTENSIONS = (".csv", ".json")
+GZIP_SUFFIX = ".gz"
+HASH_CHUNK_SIZE = 1024**2
+
+
+def file_digests(fp: BinaryIO) -> Tuple[str, str]:
+    """sha256 and md5 hex digests of the rest of `fp`, read in chunks"""
+    sha256, md5 = hashlib.sha256(), hashlib.md5()
+    for _chunk in iter(lambda: fp.read(HASH_CHUNK_SIZE), b""):
+        sha256.update(_chunk)
+        md5.update(_chunk)
+    return sha256.hexdigest(), md5.hexdigest()
+
+
+def gzip_file(file_path: str) -> BinaryIO:
+    """Gzip `file_path` into a temporary file, with no timestamp so identical files compress identically"""
+    compressed = tempfile.TemporaryFile()
+    with open(file_path, "rb") as src, gzip.GzipFile(fileobj=compressed, mode="wb", mtime=0) as dst:
+        shutil.copyfileobj(src, dst)
+    compressed.seek(0)
+    return compressed
+
+
+class S3Uploader(object):
+    """Uploads files to one bucket in the background with a single shared client.
+
+    `submit` returns immediately so the pipeline keeps computing while files upload,
+    `wait` blocks until every submitted upload is done. Objects whose sha256 metadata
+    or (single part) ETag already match the content, uploaded with the same settings
+    (ACL, content type, compression), are skipped.
+
+    With `compress`, CSV and JSON files go to `<key>.gz` as gzip files, the plain key
+    consumers read is left alone.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        public: bool = True,
+        workers: int = DEFAULT_UPLOAD_WORKERS,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        compress: bool = False
+    ) -> None:
+        self.bucket = bucket
+        self.public = public
+        self.compress = compress
+        # boto3 clients are thread-safe, the connection pool is sized for the multipart threads
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            config=Config(max_pool_connections=workers * MULTIPART_CONCURRENCY)
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_CHUNKSIZE,
+            max_concurrency=MULTIPART_CONCURRENCY
+        )
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="s3-upload")
+        self._futures: List[Future] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "S3Uploader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _remote_digests(self, key: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """sha256 metadata, ETag and settings metadata of `key`, all None if it doesn't exist"""
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None, None, None
+            raise
+        metadata = head.get("Metadata", {})
+        return metadata.get("sha256"), head.get("ETag", "").strip('"'), metadata.get("settings")
+
+    @staticmethod
+    def settings_digest(extra_args: Dict) -> str:
+        """Short digest of the upload settings (ACL, content type, metadata aside)"""
+        return hashlib.sha256(json.dumps(extra_args, sort_keys=True).encode()).hexdigest()[:16]
+
+    def upload(self, file_path: str, key: Optional[str] = None) -> bool:
+        """Upload `file_path` as `key` (its file name by default) now, returns False if it was already there"""
+        key = os.path.basename(file_path) if key is None else key
+        extra_args: Dict = {"ContentType": mimetypes.guess_type(file_path)[0] or "application/octet-stream"}
+        if self.public:
+            extra_args["ACL"] = "public-read"
+
+        if self.compress and file_path.endswith(GZIP_EXTENSIONS):
+            fp = gzip_file(file_path)
+            key += GZIP_SUFFIX
+            extra_args["ContentType"] = "application/gzip"
+        else:
+            fp = open(file_path, "rb")
+        # ACL and headers can't be compared on the object itself, a digest of them is stored alongside
+        settings = S3Uploader.settings_digest(extra_args)
+
+        with fp:
+            sha256, md5 = file_digests(fp)
+            size = fp.tell()
+            fp.seek(0)
+
+            # multipart ETags aren't an md5 of the content, the sha256 metadata covers those
+            remote_sha256, remote_etag, remote_settings = self._remote_digests(key)
+            if (remote_sha256 == sha256 or remote_etag == md5) and remote_settings == settings:
+                metrics.record_request("s3", None, "skip_unchanged", 0., 0, 0)
+                logging.info(f"s3://{self.bucket}/{key} is unchanged, skipping {file_path}")
+                return False
+
+            st = time.perf_counter()
+            extra_args["Metadata"] = {"sha256": sha256, "settings": settings}
+            self.client.upload_fileobj(fp, self.bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+            metrics.record_request("s3", None, "upload", time.perf_counter() - st, size)
+
+        logging.info(f"Pushed {file_path} to s3://{self.bucket}/{key} ({size} bytes)")
+        return True
+
+    def submit(self, file_path: str, key: Optional[str] = None) -> Future:
+        """Upload `file_path` in the background, errors are raised by `wait`"""
+        future = self._executor.submit(self.upload, file_path, key)
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def wait(self) -> int:
+        """Block until every submitted upload is done, returns the number of files actually uploaded"""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        return sum(_future.result() for _future in futures)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
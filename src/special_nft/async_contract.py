@@ -0,0 +1,23 @@
+from web3 import Web3
+
+from ..multicall import decode_result, encode_call
+from ..rpc import get_async_client
+from .contract import SPECIAL_NFT_ADDRESS, SPECIAL_NFT_CHAIN
+
+
+class AsyncSpecialNFTContract(object):
+    """Non-blocking reads of the special NFT for the bot's event loop"""
+    
+    def __init__(self) -> None:
+        self.chain = SPECIAL_NFT_CHAIN
+        self.address = SPECIAL_NFT_ADDRESS
+        self.client = get_async_client(self.chain)
+        
+    async def total_supply(self) -> int:
+        data = await self.client.eth_call(self.address, encode_call("totalSupply()"))
+        return decode_result(["uint256"], data)[0]
+        
+    async def balance_of(self, address: str) -> int:
+        address = Web3.to_checksum_address(address)
+        data = await self.client.eth_call(self.address, encode_call("balanceOf(address)", ["address"], [address]))
+        return decode_result(["uint256"], data)[0]
@@ -2,13 +2,22 @@ import asyncio
 import logging
 import os
 from concurrent.futures import ThreadPoolExecutor
-from typing import List
+from typing import Any, Dict, List, Optional, Set
 
-from web3 import Web3, HTTPProvider
+from web3 import Web3
 
 from .abi import nft_abi
 from ..constant import Asset, Chain
-from ..providers import default_providers
+from ..erc20.logs import LogFetcher, find_deployment_block
+from ..multicall import decode_result, encode_call, execute_calls
+from ..providers import get_provider
+
+
+# special NFT was in Arbitrum
+# https://arbiscan.io/address/0xC88a0B7BCB32283a2B2Fc00aD3DF234eA4a8e6E5
+SPECIAL_NFT_CHAIN = Chain.ARBITRUM_ONE
+SPECIAL_NFT_ADDRESS = "0xC88a0B7BCB32283a2B2Fc00aD3DF234eA4a8e6E5"
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
 
 
 class LPNotFoundException(Exception):
@@ -19,13 +28,12 @@ class SpecialNFTContract(object):
 
     @staticmethod
     def get_default_provider(chain: Chain) -> Web3:
-        return Web3(HTTPProvider(default_providers[chain]))
+        return get_provider(chain)
     
     def __init__(self) -> None:
         # constant for special NFT
-        # https://arbiscan.io/address/0xC88a0B7BCB32283a2B2Fc00aD3DF234eA4a8e6E5
-        chain = Chain.ARBITRUM_ONE # special NFT was in Arbitrum
-        address = "0xC88a0B7BCB32283a2B2Fc00aD3DF234eA4a8e6E5"
+        chain = SPECIAL_NFT_CHAIN
+        address = SPECIAL_NFT_ADDRESS
         
         self.provider = SpecialNFTContract.get_default_provider(chain)
         self.chain = chain
@@ -56,4 +64,65 @@ class SpecialNFTContract(object):
     def balance_of(self, address: str) -> int:
         address = Web3.to_checksum_address(address)
         return self.contract.functions.balanceOf(address).call()
-    
\ No newline at end of file
+    
+    def get_num_minted(self, block_identifier: Any = "latest") -> int:
+        return self.contract.functions.getNumMinted().call(block_identifier=block_identifier)
+    
+    def holders(self, method: str = "sweep", from_block: Optional[int] = None, block: Optional[int] = None) -> Set[str]:
+        """Lowercase addresses of every wallet holding at least one special NFT at `block` (latest by default).
+        
+        - `sweep`: `ownerOf` of every minted token id through Multicall3
+        - `logs`: replay `Transfer` events from `from_block` (defaults to the deployment block)
+        """
+        if method == "sweep":
+            owners = self._sweep_owners(block)
+        elif method == "logs":
+            owners = self._replay_owners(from_block, block)
+        else:
+            raise ValueError(f"Unknown method {method}")
+        
+        return {_owner for _owner in owners.values() if _owner != ZERO_ADDRESS}
+    
+    def _sweep_owners(self, block: Optional[int] = None) -> Dict[int, str]:
+        block_identifier = "latest" if block is None else block
+        # token ids are sequential, ids that were never minted or got burned revert and are skipped
+        token_ids = list(range(self.get_num_minted(block_identifier) + 1))
+        calls = [(self.address, encode_call("ownerOf(uint256)", ["uint256"], [_id])) for _id in token_ids]
+        results = execute_calls(self.chain, calls, block_identifier=block_identifier)
+        
+        return {
+            _id: decode_result(["address"], _data)[0].lower()
+            for _id, _data in zip(token_ids, results) if _data is not None
+        }
+    
+    def _replay_owners(self, from_block: Optional[int] = None, to_block: Optional[int] = None) -> Dict[int, str]:
+        if from_block is None:
+            from_block = find_deployment_block(self.provider, self.address)
+        if to_block is None:
+            to_block = self.provider.eth.block_number
+        
+        # the last transfer of a token id decides its owner
+        owners = dict()
+        fetcher = LogFetcher(self.chain, self.contract, "Transfer", provider=self.provider)
+        for _event in fetcher.iter_events(from_block, to_block):
+            owners[_event["args"]["tokenId"]] = _event["args"]["to"].lower()
+        
+        return owners
+    
+    def batch_balance_of(
+        self, 
+        addresses: List[str], 
+        transport: str = "batch", 
+        block_identifier: Any = "latest"
+    ) -> Dict[str, Optional[int]]:
+        """`balanceOf` of many wallets as one Multicall3 call or JSON-RPC batch, failed reads are None"""
+        calls = [
+            (self.address, encode_call("balanceOf(address)", ["address"], [Web3.to_checksum_address(_address)]))
+            for _address in addresses
+        ]
+        results = execute_calls(self.chain, calls, block_identifier=block_identifier, transport=transport)
+        
+        return {
+            _address: None if _data is None else decode_result(["uint256"], _data)[0]
+            for _address, _data in zip(addresses, results)
+        }
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from web3 import Web3
+
+from .async_contract import AsyncSpecialNFTContract
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+# cached balances are trusted this long without a successful event refresh
+DEFAULT_TTL = float(os.getenv("NFT_CACHE_TTL", 600))
+# most wallets cached at once, the least recently looked up ones are evicted first
+DEFAULT_MAX_SIZE = int(os.getenv("NFT_CACHE_SIZE", 10_000))
+# beyond this many blocks since the last refresh the cache is dropped instead of replayed
+MAX_REFRESH_RANGE = 10_000
+
+
+class SpecialNFTService(object):
+    """Long-lived special NFT balance lookups for the bot.
+    
+    Balances are answered from an LRU cache of at most `max_size` wallets with a
+    TTL, and concurrent lookups of the same wallet share one RPC call. `refresh()`
+    replays recent `Transfer` events and only evicts wallets that were part of a
+    transfer, so every other cached balance stays valid without touching the RPC.
+    """
+    
+    def __init__(self, ttl: float = DEFAULT_TTL, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.contract = AsyncSpecialNFTContract()
+        
+        # wallet -> (balance, cached_at)
+        self._cache: OrderedDict = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = dict()
+        self.last_block: Optional[int] = None
+        # bumped by every refresh, reads started before one may predate a transfer it evicted
+        self._generation = 0
+        
+    @staticmethod
+    def normalize(wallet: str) -> str:
+        return Web3.to_checksum_address(wallet).lower()
+    
+    async def _fetch(self, wallet: str) -> int:
+        generation = self._generation
+        try:
+            balance = await self.contract.balance_of(wallet)
+            # a refresh ran meanwhile, the balance is still answered but not trusted for later
+            if generation != self._generation:
+                return balance
+            self._cache[wallet] = (balance, time.time())
+            self._cache.move_to_end(wallet)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+            return balance
+        finally:
+            # a refresh may have let a newer read of the wallet take the slot
+            if self._inflight.get(wallet) is asyncio.current_task():
+                self._inflight.pop(wallet)
+    
+    async def balance_of(self, wallet: str) -> int:
+        wallet = SpecialNFTService.normalize(wallet)
+        
+        cached = self._cache.get(wallet)
+        if cached is not None and time.time() - cached[1] <= self.ttl:
+            self._cache.move_to_end(wallet)
+            return cached[0]
+        
+        # coalesce concurrent lookups of the same wallet into one request
+        if wallet not in self._inflight:
+            self._inflight[wallet] = asyncio.ensure_future(self._fetch(wallet))
+        return await asyncio.shield(self._inflight[wallet])
+    
+    async def refresh(self) -> None:
+        """Apply `Transfer` events since the last refresh to the cache"""
+        self._generation += 1
+        # lookups from now on don't join reads that started before this refresh
+        self._inflight.clear()
+        head = await self.contract.client.block_number()
+        
+        if self.last_block is None or head - self.last_block > MAX_REFRESH_RANGE:
+            # too far behind to replay, start over from the current head
+            self._cache.clear()
+        elif head > self.last_block:
+            logs = await self.contract.client.get_logs(
+                self.contract.address, [TRANSFER_TOPIC], self.last_block + 1, head
+            )
+            
+            touched = set()
+            for _log in logs:
+                touched.add("0x" + _log["topics"][1][-40:].lower())
+                touched.add("0x" + _log["topics"][2][-40:].lower())
+            for _wallet in touched:
+                self._cache.pop(_wallet, None)
+            
+            # nothing else changed, so the remaining balances are current as of `head`
+            now = time.time()
+            for _wallet, (_balance, _) in list(self._cache.items()):
+                self._cache[_wallet] = (_balance, now)
+            
+            logging.info(f"Special NFT cache refreshed to block {head}, {len(touched)} wallets evicted, {len(self._cache)} cached")
+        
+        self.last_block = head
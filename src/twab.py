@@ -0,0 +1,181 @@
+"""Time-weighted average balances (TWAB) of an ERC20 over an epoch of blocks.
+
+Epochs are set in seconds and resolved to a block range per chain, block times differ
+by an order of magnitude between the chains we track.
+
+A wallet holding `b` for the whole epoch scores `b`, one that deposited halfway
+through scores `b / 2`, so topping up right before the snapshot earns little.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from web3 import Web3
+
+from .constant import Chain
+from .erc20 import ERC20
+from .indexer import TransferIndexer
+from .multicall import encode_call, execute_calls
+from .providers import get_provider
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+DEFAULT_EPOCH_SECONDS = 7 * 24 * 3600
+DEFAULT_SAMPLES = 100
+# sample blocks read concurrently, each one is a few multicall requests
+DEFAULT_SAMPLE_WORKERS = 4
+# uint256 words are decoded as 4 big-endian uint64 limbs
+UINT256_LIMBS = 2. ** np.array([192, 128, 64, 0])
+
+
+def twab_from_deltas(
+    wallets: np.ndarray,
+    blocks: np.ndarray,
+    deltas: np.ndarray,
+    start_block: int,
+    end_block: int
+) -> pd.Series:
+    """TWAB of every wallet over [start_block, end_block) from its balance deltas in log order.
+
+    A delta at block `b` counts from `b` on, deltas before `start_block` make up the opening balance.
+    """
+    keep = blocks < end_block
+    df = pd.DataFrame({
+        "wallet": wallets[keep],
+        "block": np.maximum(blocks[keep], start_block),
+        "delta": deltas[keep]
+    })
+
+    # balance after each delta, held until the wallet's next delta or the end of the epoch
+    df = df.sort_values(["wallet", "block"], kind="stable")
+    groups = df.groupby("wallet", sort=False)
+    balance = groups["delta"].cumsum()
+    next_block = groups["block"].shift(-1).fillna(end_block)
+
+    weighted = balance * (next_block - df["block"])
+    return weighted.groupby(df["wallet"]).sum() / (end_block - start_block)
+
+
+def twab_from_transfers(transfers: pd.DataFrame, start_block: int, end_block: int) -> pd.Series:
+    """TWAB from `TransferIndexer.get_transfers()`, mints and burns only move the other side"""
+    blocks = transfers["block_number"].to_numpy()
+    values = transfers["value"].astype(np.float64).to_numpy()
+
+    # every transfer is a debit of the sender and a credit of the recipient
+    wallets = np.concatenate([transfers["sender"].to_numpy(), transfers["recipient"].to_numpy()])
+    deltas = np.concatenate([-values, values])
+    blocks = np.concatenate([blocks, blocks])
+
+    # keep log order between the debit and credit of the same block
+    order = np.argsort(blocks, kind="stable")
+    wallets, blocks, deltas = wallets[order], blocks[order], deltas[order]
+
+    minted = wallets != ZERO_ADDRESS
+    return twab_from_deltas(wallets[minted], blocks[minted], deltas[minted], start_block, end_block)
+
+
+def find_block_at(chain: Chain, timestamp: int, end_block: int) -> int:
+    """First block at or after `timestamp` up to `end_block`, binary searched on block timestamps"""
+    provider = get_provider(chain)
+    low, high = 0, end_block
+    while low < high:
+        mid = (low + high) // 2
+        if provider.eth.get_block(mid)["timestamp"] < timestamp:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+
+def epoch_start_block(chain: Chain, end_block: int, epoch_seconds: int = DEFAULT_EPOCH_SECONDS) -> int:
+    """Start block of the epoch of `epoch_seconds` ending at `end_block` on `chain`"""
+    end_timestamp = get_provider(chain).eth.get_block(end_block)["timestamp"]
+    return find_block_at(chain, end_timestamp - epoch_seconds, end_block)
+
+
+def get_sample_blocks(start_block: int, end_block: int, samples: int = DEFAULT_SAMPLES) -> np.ndarray:
+    return np.unique(np.linspace(start_block, end_block, samples, endpoint=False).astype(np.int64))
+
+
+def decode_balances(results: Sequence[Optional[bytes]]) -> np.ndarray:
+    """`balanceOf` return data to float balances, failed calls count as 0"""
+    words = b"".join(bytes(32) if _r is None or len(_r) < 32 else bytes(_r[-32:]) for _r in results)
+    limbs = np.frombuffer(words, dtype=">u8").reshape(-1, 4).astype(np.float64)
+    return limbs @ UINT256_LIMBS
+
+
+def sample_balances(
+    chain: Chain,
+    token: str,
+    wallets: Sequence[str],
+    blocks: Sequence[int],
+    transport: str = "multicall",
+    workers: int = DEFAULT_SAMPLE_WORKERS
+) -> np.ndarray:
+    """Raw `balanceOf` of `wallets` at each of `blocks`, shaped (len(blocks), len(wallets))"""
+    token = Web3.to_checksum_address(token)
+    # the same calls are replayed at every block, encode them once
+    calls = [
+        (token, encode_call("balanceOf(address)", ["address"], [Web3.to_checksum_address(_wallet)]))
+        for _wallet in wallets
+    ]
+
+    def _sample(block: int) -> np.ndarray:
+        results = execute_calls(chain, calls, block_identifier=int(block), transport=transport)
+        failed = sum(_r is None for _r in results)
+        if failed > 0:
+            logging.warning(f"{failed} balanceOf calls of {token} failed at block {block}")
+        return decode_balances(results)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return np.vstack(list(executor.map(_sample, blocks)))
+
+
+def twab_from_samples(balances: np.ndarray, blocks: np.ndarray, end_block: int) -> np.ndarray:
+    """TWAB of each column of `balances`, every sample holds until the next sample block"""
+    weights = np.diff(np.append(blocks, end_block)).astype(np.float64)
+    return weights @ balances / weights.sum()
+
+
+def get_twab(
+    chain: Chain,
+    token: str,
+    start_block: int,
+    end_block: int,
+    method: str = "transfers",
+    wallets: Optional[Sequence[str]] = None,
+    samples: int = DEFAULT_SAMPLES,
+    transport: str = "multicall",
+    raw: bool = False
+) -> Dict[str, float]:
+    """TWAB of holders of `token` over [start_block, end_block), same shape as
+    `AnkrAPI.get_token_holders_and_balance`. Averages stay in raw token units with `raw=True`.
+
+    `method="transfers"` replays the token's Transfer logs from the local indexer,
+    `method="samples"` reads `balanceOf` of `wallets` at `samples` evenly spaced blocks.
+    """
+    decimal = ERC20(chain, token).decimal
+    logging.info(f"Computing {method} TWAB of {token} on {chain} from block {start_block} to {end_block}")
+
+    if method == "transfers":
+        indexer = TransferIndexer(chain, token)
+        try:
+            synced = indexer.sync(to_block=end_block)
+            if synced < end_block:
+                raise ValueError(f"Block {end_block} on {chain} isn't confirmed yet, the indexer stops at {synced}")
+            twab = twab_from_transfers(indexer.get_transfers(to_block=end_block), start_block, end_block)
+        finally:
+            indexer.close()
+    elif method == "samples":
+        if wallets is None:
+            raise ValueError("Sampled TWAB requires wallets")
+        blocks = get_sample_blocks(start_block, end_block, samples)
+        balances = sample_balances(chain, token, wallets, blocks, transport=transport)
+        twab = pd.Series(twab_from_samples(balances, blocks, end_block), index=list(wallets))
+    else:
+        raise ValueError(f"Unknown TWAB method {method}")
+
+    twab = twab[twab > 0]
+    return (twab if raw else twab / 10**decimal).to_dict()